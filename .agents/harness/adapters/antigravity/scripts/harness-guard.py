@@ -7,10 +7,157 @@ Copyright: Ben Chatelain. Apache 2.0.
 from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
+import socket
 import subprocess
 import sys
 
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from guard_deadline import GuardDeadline
+
+HOOKS = Path.home() / ".agents" / "harness" / "hooks"
+SOCKET = Path(
+    os.environ.get("AGENT_HARNESS_GUARD_SOCKET")
+    or Path.home() / ".agents" / "harness" / "run" / "guard.sock"
+)
+
+
+def ask_guard(request: dict) -> dict:
+    """The verdict for `request`, denied if the harness's budget runs out first.
+
+    A running `guard-server` is asked first, then the guard client in this
+    process, then a spawned guard, all against one deadline.
+    """
+
+    sys.path.insert(0, str(HOOKS))
+    try:
+        from guard_snapshot import install_snapshot
+
+        install_snapshot()
+    except (ImportError, SyntaxError):
+        pass
+    try:
+        from guard_deadline import GuardDeadline
+    except (ImportError, SyntaxError) as exc:
+        # Without the shared hooks only a running guard-server can answer, given
+        # guard_deadline.DEFAULT_GUARD_BUDGET to do it in.
+        verdict = ask_server(request, timeout=2.5)
+        return verdict or {
+            "decision": "deny",
+            "reason": f"shared guard failed closed: {exc}",
+        }
+    deadline = GuardDeadline(request["harness"])
+    verdict = ask_server(request, timeout=deadline.remaining())
+    if verdict is None and deadline.expired():
+        return deadline.overrun("guard-server")
+    if verdict is None:
+        verdict = ask_in_process(request, deadline)
+    if verdict is None:
+        verdict = spawn_guard(request, deadline)
+    return verdict
+
+
+def ask_server(request: dict, *, timeout: float) -> dict | None:
+    """Ask a running `guard-server`, or return None to evaluate another way.
+
+    Only a server this user started is asked: its socket and token file must be
+    this user's alone, the peer must run as this user where the platform can
+    tell, and the reply must carry the token the server drew at startup.
+    """
+
+    token_path = Path(f"{SOCKET}.token")
+    try:
+        if not (owned_privately(SOCKET) and owned_privately(token_path)):
+            return None
+        token = token_path.read_text().strip()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(str(SOCKET))
+            if peer_uid(client) not in (None, os.geteuid()):
+                return None
+            client.sendall((json.dumps({**request, "close": True}) + "\n").encode())
+            reply = json.loads(client.makefile("rb").readline())
+    except (OSError, ValueError):
+        return None
+    if not token or not isinstance(reply, dict) or reply.pop("token", None) != token:
+        return None
+    return reply if "decision" in reply else None
+
+
+def owned_privately(path: Path) -> bool:
+    """Whether `path` itself is this user's and closed to everyone else."""
+
+    stat = path.lstat()
+    return stat.st_uid == os.geteuid() and not stat.st_mode & 0o077
+
+
+def peer_uid(client: socket.socket) -> int | None:
+    """The uid of the process at the other end of `client`, where the OS says."""
+
+    import struct
+
+    if hasattr(socket, "SO_PEERCRED"):
+        # struct ucred: pid, uid, gid.
+        creds = client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)
+        return struct.unpack("3i", creds)[1]
+    if sys.platform == "darwin":
+        # LOCAL_PEERCRED at SOL_LOCAL; struct xucred opens with version, uid.
+        creds = client.getsockopt(0, 0x001, 76)
+        return struct.unpack("2I", creds[:8])[1]
+    return None
+
+
+def ask_in_process(request: dict, deadline: GuardDeadline) -> dict | None:
+    """Evaluate with the shared guard client here, or return None to spawn it."""
+
+    try:
+        from guard_client import guard_request
+    except (ImportError, SyntaxError):
+        return None
+    return guard_request(request, deadline=deadline)
+
+
+def spawn_guard(request: dict, deadline: GuardDeadline) -> dict:
+    """Ask a guard process, killed if it outlives the deadline.
+
+    The call goes over stdin, not argv, so a large write cannot hit ARG_MAX.
+    """
+
+    # Built by `generate` under run/; run only when it is this user's alone.
+    bundle = HOOKS.parent / "run" / "harness-guard.pyz"
+    try:
+        bundled = owned_privately(bundle)
+    except OSError:
+        bundled = False
+    if bundled:
+        argv = ["python3", "-I", "-S", str(bundle)]
+    else:
+        argv = ["python3", str(Path.home() / "scripts" / "agent-harnesses.py"), "guard"]
+    try:
+        result = subprocess.run(
+            [*argv, "--harness", request["harness"], "--stdin"],
+            input=json.dumps(request) + "\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False,
+            timeout=deadline.remaining(),
+        )
+    except subprocess.TimeoutExpired:
+        return deadline.overrun("spawned guard")
+    except OSError as exc:
+        return {"decision": "deny", "reason": f"shared guard failed closed: {exc}"}
+    try:
+        verdict = json.loads(result.stdout)
+    except ValueError:
+        verdict = None
+    if not isinstance(verdict, dict) or "decision" not in verdict:
+        detail = result.stderr.strip() or "no guard output"
+        return {"decision": "deny", "reason": f"shared guard failed closed: {detail}"}
+    return verdict
+
 
 def main() -> int:
     payload = json.load(sys.stdin)
@@ -19,46 +166,17 @@ def main() -> int:
     path = str(payload.get("path", ""))
     content = str(payload.get("content", ""))
     cwd = str(payload.get("cwd", ""))
-    script = Path.home() / "scripts" / "agent-harnesses.py"
-    args = [
-        "python3",
-        str(script),
-        "guard",
-        "--harness",
-        "antigravity",
-        "--tool",
-        tool,
-        "--command",
-        command,
-        "--path",
-        path,
-        "--content",
-        content,
-    ]
-    if cwd:
-        args.extend(["--cwd", cwd])
-    result = subprocess.run(
-        args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=False,
-    )
-    print(result.stdout, end="")
-    if result.stdout:
-        return result.returncode
-    print(
-        json.dumps(
-            {
-                "harness": "antigravity",
-                "tool": tool,
-                "decision": "deny",
-                "reason": "Shared guard failed closed",
-            },
-            sort_keys=True,
-        )
-    )
-    return 2
+    request = {
+        "harness": "antigravity",
+        "tool": tool,
+        "command": command,
+        "path": path,
+        "content": content,
+        "cwd": cwd,
+    }
+    verdict = ask_guard(request)
+    print(json.dumps(verdict, sort_keys=True))
+    return 0 if verdict["decision"] in {"allow", "warn"} else 2
 
 
 if __name__ == "__main__":
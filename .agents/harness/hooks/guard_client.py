@@ -0,0 +1,948 @@
+"""In-process client for the shared agent harness guard.
+
+`guard_request` is the whole verdict for one tool call: the safety policy, the
+generated-artifact rule, and the verdict cache. `scripts/agent-harnesses.py
+guard` and `guard-server` are front ends over it, and the generated Python
+wrappers import it directly, so a hook costs one interpreter rather than two.
+`guard_main` is the `guard` command line itself, which the generated
+harness-guard.pyz bundle runs without the generator behind it. With `--hook` it
+answers a Claude or Codex PreToolUse hook directly, envelope in and reply out.
+
+Copyright: Ben Chatelain. Apache 2.0.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Hooks import this on every tool call; `typing` alone would cost more than the
+# rest of the module, and the names are only needed by type checkers.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from collections.abc import Collection
+    from typing import Any
+
+HOME = Path(os.environ.get("HOME", str(Path.home()))).resolve()
+SHARED = HOME / ".agents" / "harness"
+HOOKS = Path(__file__).resolve().parent
+# Every path `agent-harnesses.py generate` writes, mapped to the hand-written
+# file behind it.
+GENERATED_MANIFEST = SHARED / "generated-paths.json"
+# Set when this module runs from inside harness-guard.pyz. The bundle then
+# stands in for safety.py and this file, which have no paths of their own, and
+# carries the manifest's suffix index prebuilt as GUARD_BUNDLE_INDEX.
+GUARD_BUNDLE = getattr(globals().get("__loader__"), "archive", None)
+GUARD_BUNDLE_INDEX = "generated-index.json"
+# The hooks a bundle copies. It runs its copies only while every one of these,
+# in hooks/, is as it was when the bundle was built.
+GUARD_BUNDLE_SOURCES = (
+    "guard_client.py",
+    "guard_deadline.py",
+    "guard_snapshot.py",
+    "safety.py",
+)
+
+if str(HOOKS) not in sys.path:
+    sys.path.insert(0, str(HOOKS))
+try:
+    from safety import (  # type: ignore
+        PATCH_TOOLS,
+        GuardDecision,
+        PathResolver,
+        consults_git,
+        evaluate,
+        parse_apply_patch,
+        resolved_paths,
+    )
+except Exception as exc:  # noqa: BLE001 - any failure must become a deny
+    SAFETY_IMPORT_ERROR: Exception | None = exc
+else:
+    SAFETY_IMPORT_ERROR = None
+from guard_deadline import DeadlineExceeded, GuardDeadline  # type: ignore
+
+try:
+    from guard_snapshot import installed_snapshot  # type: ignore
+except ImportError:  # pragma: no cover - only hit before installation
+
+    def installed_snapshot() -> dict[str, Any] | None:
+        return None
+
+
+def guard_request(
+    request: Any,
+    *,
+    harnesses: Collection[str] | None = None,
+    reuse_paths: bool = False,
+    deadline: GuardDeadline | None = None,
+) -> dict[str, str]:
+    """Answer one guard request object, failing closed on a malformed one.
+
+    The request carries the `guard` flags as fields: `harness`, `tool`, and
+    optionally `command`, `path`, `content`, and `cwd`. Non-string values are
+    treated as empty. When `harnesses` is given, `harness` must be one of them.
+    A long-lived caller passes `reuse_paths` to share path resolutions across
+    requests for up to PATH_RESOLUTION_TTL seconds. A caller that has already
+    spent part of the call's budget passes its `deadline` on.
+    """
+
+    if not isinstance(request, dict):
+        return {
+            "decision": "deny",
+            "reason": "shared guard failed closed: request is not a JSON object",
+        }
+    harness = request.get("harness")
+    tool = request.get("tool")
+    if (
+        not isinstance(harness, str)
+        or (harnesses is not None and harness not in harnesses)
+        or not isinstance(tool, str)
+        or not tool
+    ):
+        return {
+            "decision": "deny",
+            "reason": "shared guard failed closed: "
+            "request needs a known harness and a tool",
+        }
+    fields: dict[str, str] = {}
+    for key in ("command", "path", "content", "cwd"):
+        value = request.get(key, "")
+        fields[key] = value if isinstance(value, str) else ""
+    refresh_safety_policy()
+    reuse = reuse_paths and SAFETY_IMPORT_ERROR is None
+    resolver = shared_path_resolver() if reuse else None
+    return guard_payload(harness, tool, resolver=resolver, deadline=deadline, **fields)
+
+
+# How long a long-lived guard trusts a path it has already resolved. Short, so
+# that a symlink an agent repoints is matched by its new target almost at once.
+PATH_RESOLUTION_TTL = 1.0
+_PATH_RESOLVER: PathResolver | None = None
+
+
+def shared_path_resolver() -> PathResolver:
+    """The resolver long-lived guards share, rebuilt when safety.py reloads."""
+
+    global _PATH_RESOLVER
+    if not isinstance(_PATH_RESOLVER, PathResolver):
+        _PATH_RESOLVER = PathResolver(ttl=PATH_RESOLUTION_TTL)
+    return _PATH_RESOLVER
+
+
+def guard_payload(
+    harness: str,
+    tool: str,
+    *,
+    command: str = "",
+    path: str = "",
+    content: str = "",
+    cwd: str = "",
+    resolver: PathResolver | None = None,
+    deadline: GuardDeadline | None = None,
+) -> dict[str, str]:
+    """The verdict `guard` prints for one normalized tool call.
+
+    `rule` is included when a rule decided, naming it. Evaluation runs against
+    `deadline`, by default the harness's whole budget, and is denied when it
+    runs out.
+    """
+
+    if SAFETY_IMPORT_ERROR is not None:
+        return {
+            "decision": "deny",
+            "reason": f"safety module unavailable: {SAFETY_IMPORT_ERROR}",
+        }
+
+    started = time.perf_counter()
+    deadline = deadline or GuardDeadline(harness)
+    cached = False
+    if deadline.expired():
+        verdict = deadline.overrun("evaluate")
+    else:
+        try:
+            with deadline:
+                verdict, cached = _evaluate_call(
+                    tool,
+                    command=command,
+                    path=path,
+                    content=content,
+                    cwd=cwd or str(HOME),
+                    resolver=resolver or PathResolver(),
+                )
+        except DeadlineExceeded:
+            verdict = deadline.overrun("evaluate")
+    if GUARD_TELEMETRY is not None:
+        record_guard_telemetry(
+            harness,
+            tool,
+            verdict,
+            seconds=time.perf_counter() - started,
+            size=len(command) + len(path) + len(content),
+            cached=cached,
+        )
+    return {"harness": harness, "tool": tool, **verdict}
+
+
+def _evaluate_call(
+    tool: str,
+    *,
+    command: str,
+    path: str,
+    content: str,
+    cwd: str,
+    resolver: PathResolver,
+) -> tuple[dict[str, str], bool]:
+    """(verdict, whether it came from the cache) for one tool call."""
+
+    # The cache key and the evaluation resolve the same paths; do it once.
+    key = guard_cache_key(
+        tool, command=command, path=path, content=content, cwd=cwd, resolver=resolver
+    )
+    verdict = read_guard_cache(key) if key else None
+    cached = verdict is not None
+    if verdict is None:
+        decision = evaluate(
+            tool,
+            command=command,
+            path=path,
+            content=content,
+            cwd=cwd,
+            resolver=resolver,
+        )
+        if decision.allowed:
+            # An apply_patch call writes every path its envelope names.
+            if tool.lower().strip() in PATCH_TOOLS:
+                writes = [
+                    ("write", target)
+                    for target in parse_apply_patch(command or content)[0]
+                ]
+            else:
+                writes = [(tool, path)] if path else []
+            for write_tool, target in writes:
+                generated = generated_path_warning(
+                    write_tool, target, cwd=cwd, resolver=resolver
+                )
+                if generated:
+                    decision = GuardDecision("deny", generated, "generated-artifact")
+                    break
+        verdict = {"decision": decision.decision, "reason": decision.reason}
+        if decision.rule:
+            verdict["rule"] = decision.rule
+        if key:
+            ttl = GUARD_CACHE_GIT_TTL if consults_git(tool, command=command) else None
+            write_guard_cache(key, verdict, ttl=ttl)
+    return verdict, cached
+
+
+def parse_guard_args(
+    argv: list[str], *, harnesses: Collection[str]
+) -> dict[str, Any] | None:
+    """Parse the `guard` flags by hand, or return None when they do not parse.
+
+    `--command` maps to `shell_command`; `--harness` must be one of `harnesses`,
+    and `--tool` is required unless `--stdin` is given. `--hook` stands in for
+    all three. Parsing by hand keeps argparse off the hook path.
+    """
+
+    flag_map = {
+        "--hook": "hook",
+        "--harness": "harness",
+        "--tool": "tool",
+        "--command": "shell_command",
+        "--path": "path",
+        "--content": "content",
+        "--cwd": "cwd",
+    }
+    opts: dict[str, Any] = {
+        "harness": None,
+        "tool": None,
+        "shell_command": "",
+        "path": "",
+        "content": "",
+        "cwd": str(HOME),
+        "stdin": False,
+        "hook": None,
+    }
+    index = 0
+    while index < len(argv):
+        if argv[index] == "--stdin":
+            opts["stdin"] = True
+            index += 1
+            continue
+        key = flag_map.get(argv[index])
+        if key is None or index + 1 >= len(argv):
+            return None
+        opts[key] = argv[index + 1]
+        index += 2
+    if opts["hook"] is not None:
+        if opts["hook"] not in HOOK_HARNESSES:
+            return None
+        if opts["harness"] not in {None, opts["hook"]}:
+            return None
+        opts["harness"] = opts["hook"]
+    if opts["harness"] not in harnesses:
+        return None
+    if not (opts["tool"] or opts["stdin"] or opts["hook"]):
+        return None
+    return opts
+
+
+def guard_stream(
+    stream: Any, *, harness: str, cwd: str, harnesses: Collection[str]
+) -> int:
+    """Answer newline-delimited JSON tool calls from `stream`, one verdict per line.
+
+    Each line carries the `guard` flags as fields (`tool`, `command`, `path`,
+    `content`, `cwd`, and optionally `harness`, which defaults to `harness`).
+    Verdicts are flushed as they are written, so a caller can hold the process
+    open and feed it calls one at a time. Returns 2 when any call was denied.
+    """
+
+    denied = False
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as exc:
+            payload = {
+                "decision": "deny",
+                "reason": f"shared guard failed closed: unreadable request ({exc})",
+            }
+        else:
+            if isinstance(request, dict):
+                request = {"harness": harness, "cwd": cwd, **request}
+            payload = guard_request(request, harnesses=harnesses, reuse_paths=True)
+        denied = denied or payload["decision"] not in {"allow", "warn"}
+        print(json.dumps(payload, sort_keys=True), flush=True)
+    return 2 if denied else 0
+
+
+# Harnesses whose PreToolUse hooks `guard --hook` answers itself. Both send the
+# same envelope (`tool_name`, `tool_input`, `cwd`) and read the same reply.
+HOOK_HARNESSES = ("claude", "codex")
+HOOK_PATH_KEYS = ("file_path", "path", "notebook_path")
+# Tools whose `command` is a shell command line, whatever it looks like.
+HOOK_SHELL_TOOLS = frozenset({"Bash", "shell"})
+# How strict each decision is, so a call judged two ways keeps the stricter.
+HOOK_STRICTNESS = {"allow": 0, "warn": 1}
+HOOK_CONTENT_KEYS = ("content", "new_string", "new_source")
+
+
+def guard_hook(stream: Any, *, harness: str) -> int:
+    """Answer one PreToolUse hook envelope from `stream` with the hook's reply.
+
+    A deny is a `hookSpecificOutput` permission decision and a warning is a
+    `systemMessage`; an allowed call prints nothing. The exit status is always
+    0, since the hook reads its decision from the reply, and an envelope that
+    does not parse, or any failure deciding it, is denied.
+    """
+
+    try:
+        envelope = json.loads(stream.read())
+        problem = "" if isinstance(envelope, dict) else "not a JSON object"
+    except ValueError as exc:
+        problem = str(exc)
+    if problem:
+        verdict = {
+            "decision": "deny",
+            "reason": "shared guard failed closed: "
+            f"unreadable hook payload ({problem})",
+        }
+    else:
+        try:
+            requests = hook_requests(envelope)
+            if not requests:
+                return 0
+            verdicts = [
+                guard_request({"harness": harness, **request}) for request in requests
+            ]
+            verdict = max(
+                verdicts, key=lambda each: HOOK_STRICTNESS.get(each["decision"], 2)
+            )
+        except Exception as exc:  # noqa: BLE001 - a failing hook must deny
+            verdict = {
+                "decision": "deny",
+                "reason": f"shared guard failed closed: {type(exc).__name__}: {exc}",
+            }
+    reason = verdict.get("reason") or "Shared guard failed closed"
+    if verdict["decision"] == "deny":
+        reply: dict[str, Any] = {
+            "hookSpecificOutput": {
+                "hookEventName": "PreToolUse",
+                "permissionDecision": "deny",
+                "permissionDecisionReason": reason,
+            }
+        }
+    elif verdict["decision"] == "warn" and verdict.get("reason"):
+        reply = {"systemMessage": reason}
+    else:
+        return 0
+    print(json.dumps(reply))
+    return 0
+
+
+def hook_requests(envelope: dict[str, Any]) -> list[dict[str, str]]:
+    """The guard requests for one PreToolUse envelope; the strictest verdict wins.
+
+    `apply_patch` is judged as a patch and a shell tool's command as bash, so
+    a command that merely opens like a patch is still run through the shell
+    rules. Any other tool is classified by the shape of `tool_input`, so an
+    upstream tool rename cannot unhook the guard: a command is bash, and also
+    a patch if it looks like one, then a path is a write of the new text,
+    which for a MultiEdit is every edit's.
+    """
+
+    tool_input = envelope.get("tool_input")
+    if not isinstance(tool_input, dict):
+        tool_input = {}
+    cwd = envelope.get("cwd")
+    cwd = cwd if isinstance(cwd, str) else ""
+    command = tool_input.get("command")
+    command = command if isinstance(command, str) else ""
+    tool_name = envelope.get("tool_name")
+    patch = {"tool": "apply_patch", "command": command, "cwd": cwd}
+    if tool_name == "apply_patch":
+        return [patch]
+    if command:
+        requests = [{"tool": "bash", "command": command, "cwd": cwd}]
+        if tool_name not in HOOK_SHELL_TOOLS and command.startswith("*** Begin Patch"):
+            requests.append(patch)
+        return requests
+    path = next(
+        (
+            value
+            for value in (tool_input.get(key) for key in HOOK_PATH_KEYS)
+            if isinstance(value, str) and value
+        ),
+        "",
+    )
+    if not path:
+        return []
+    edits = tool_input.get("edits")
+    sources = [tool_input, *(edits if isinstance(edits, list) else [])]
+    content = "".join(
+        value
+        for source in sources
+        if isinstance(source, dict)
+        for value in (source.get(key) for key in HOOK_CONTENT_KEYS)
+        if isinstance(value, str)
+    )
+    return [{"tool": "write", "path": path, "content": content, "cwd": cwd}]
+
+
+def guard_main(argv: list[str], *, harnesses: Collection[str]) -> int:
+    """Run `guard` with `argv` as its flags, printing the verdict as JSON.
+
+    Exits 0 on allow or warn and 2 on deny, except under `--hook`, whose reply
+    carries the decision. Flags that do not parse deny, since there is no
+    argparse behind this entry point to explain them.
+    """
+
+    opts = parse_guard_args(argv, harnesses=harnesses)
+    if opts is None:
+        print(
+            json.dumps(
+                {
+                    "decision": "deny",
+                    "reason": "shared guard failed closed: "
+                    "usage: --harness NAME (--tool TOOL | --stdin) | --hook NAME",
+                },
+                sort_keys=True,
+            )
+        )
+        return 2
+    if opts["hook"]:
+        return guard_hook(sys.stdin, harness=opts["hook"])
+    if opts["stdin"]:
+        return guard_stream(
+            sys.stdin, harness=opts["harness"], cwd=opts["cwd"], harnesses=harnesses
+        )
+    payload = guard_payload(
+        opts["harness"],
+        opts["tool"],
+        command=opts["shell_command"],
+        path=opts["path"],
+        content=opts["content"],
+        cwd=opts["cwd"],
+    )
+    print(json.dumps(payload, sort_keys=True))
+    return 0 if payload["decision"] in {"allow", "warn"} else 2
+
+
+# Telemetry is one NDJSON line per evaluated call: who asked, what was decided
+# and by which rule, how long evaluation took, and how large the call was. No
+# command, path, or content is ever written. It is off unless
+# AGENT_HARNESS_GUARD_TELEMETRY is "on" (the default log below) or a log path.
+# Like the verdict cache, the log sits under run/, out of an agent's reach.
+GUARD_TELEMETRY_LOG = SHARED / "run" / "guard-telemetry.ndjson"
+_TELEMETRY_SETTING = os.environ.get("AGENT_HARNESS_GUARD_TELEMETRY", "")
+GUARD_TELEMETRY = (
+    None
+    if _TELEMETRY_SETTING in {"", "0", "off"}
+    else GUARD_TELEMETRY_LOG
+    if _TELEMETRY_SETTING in {"1", "on"}
+    else Path(_TELEMETRY_SETTING)
+)
+# The log rotates to `.1`, `.2`, ... once it passes this size, keeping this many.
+# AGENT_HARNESS_GUARD_TELEMETRY_BYTES overrides it; anything but a positive
+# integer is ignored rather than left to fail every guard call at import.
+try:
+    GUARD_TELEMETRY_BYTES = int(
+        os.environ.get("AGENT_HARNESS_GUARD_TELEMETRY_BYTES", "")
+    )
+except ValueError:
+    GUARD_TELEMETRY_BYTES = 0
+if GUARD_TELEMETRY_BYTES <= 0:
+    GUARD_TELEMETRY_BYTES = 4 * 1024 * 1024
+GUARD_TELEMETRY_KEEP = 5
+
+
+def record_guard_telemetry(
+    harness: str,
+    tool: str,
+    verdict: dict[str, str],
+    *,
+    seconds: float,
+    size: int,
+    cached: bool,
+) -> None:
+    """Append one telemetry record. Failing to log never fails the call."""
+
+    record = {
+        "ts": round(time.time(), 3),
+        "harness": harness,
+        "tool": tool.lower().strip(),
+        "decision": verdict["decision"],
+        "rule": verdict.get("rule", ""),
+        "ms": round(seconds * 1000, 3),
+        "size": size,
+        "cached": cached,
+    }
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+    try:
+        GUARD_TELEMETRY.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # One O_APPEND write per record, so concurrent guards never interleave.
+        fd = os.open(GUARD_TELEMETRY, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            rotate = os.fstat(fd).st_size >= GUARD_TELEMETRY_BYTES
+        finally:
+            os.close(fd)
+        if rotate:
+            rotate_guard_telemetry()
+    except OSError:
+        return
+
+
+def rotate_guard_telemetry() -> None:
+    """Shift the log to `.1` and each older generation up one, dropping the last."""
+
+    for generation in range(GUARD_TELEMETRY_KEEP - 1, 0, -1):
+        older = GUARD_TELEMETRY.with_name(f"{GUARD_TELEMETRY.name}.{generation}")
+        newer = GUARD_TELEMETRY.with_name(f"{GUARD_TELEMETRY.name}.{generation + 1}")
+        try:
+            os.replace(older, newer)
+        except OSError:
+            continue
+    try:
+        os.replace(GUARD_TELEMETRY, f"{GUARD_TELEMETRY}.1")
+    except OSError:
+        pass
+
+
+def guard_telemetry_logs(log: Path) -> list[Path]:
+    """`log` and its rotated generations that exist, oldest first."""
+
+    generations = [
+        log.with_name(f"{log.name}.{generation}")
+        for generation in range(GUARD_TELEMETRY_KEEP, 0, -1)
+    ]
+    return [path for path in [*generations, log] if path.exists()]
+
+
+# Verdicts are cached on disk, one small JSON file per distinct tool call, so an
+# agent retrying a command or rewriting a file skips evaluation. The cache sits
+# under run/, which is control plane: a writable verdict cache is a way to plant
+# an "allow". AGENT_HARNESS_GUARD_CACHE=off disables it.
+_GUARD_CACHE_SETTING = os.environ.get("AGENT_HARNESS_GUARD_CACHE", "")
+GUARD_CACHE = (
+    None
+    if _GUARD_CACHE_SETTING == "off"
+    else Path(_GUARD_CACHE_SETTING or SHARED / "run" / "guard-cache")
+)
+# Least recently used entries beyond this are pruned.
+GUARD_CACHE_ENTRIES = 4096
+# The main-branch commit warning depends on git state the cache cannot see
+# change, so verdicts that consulted it are only trusted for this many seconds.
+GUARD_CACHE_GIT_TTL = 30.0
+
+_POLICY_FINGERPRINT: tuple[tuple[tuple[int, int], ...], str] | None = None
+
+
+def policy_fingerprint() -> str:
+    """A digest of everything that decides a verdict besides the call itself.
+
+    Covers safety.py, the generated-path manifest, this module, and the
+    environment settings safety.py reads. Every cache key includes it, so
+    editing any of them orphans every earlier verdict. The files are hashed
+    once per `generate`, into the guard snapshot, while it stays current.
+    Inside the bundle that means the bundle itself and the hooks it copies,
+    since safety.py is read from hooks/ once it is edited there.
+    """
+
+    global _POLICY_FINGERPRINT
+    import hashlib
+
+    if GUARD_BUNDLE:
+        files: tuple[Path, ...] = (
+            Path(GUARD_BUNDLE),
+            GENERATED_MANIFEST,
+            *(SHARED / "hooks" / name for name in GUARD_BUNDLE_SOURCES),
+        )
+    else:
+        files = (HOOKS / "safety.py", GENERATED_MANIFEST, Path(__file__))
+    stamps = []
+    for file in files:
+        try:
+            stat = file.stat()
+        except OSError:
+            stamps.append((0, -1))
+        else:
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+    stamp = tuple(stamps)
+    if _POLICY_FINGERPRINT is not None and _POLICY_FINGERPRINT[0] == stamp:
+        return _POLICY_FINGERPRINT[1]
+    snapshot = installed_snapshot()
+    recorded = snapshot["sources"] if snapshot is not None else {}
+    if all(tuple(recorded.get(str(file), ())) == s for file, s in zip(files, stamps)):
+        content = snapshot["digest"]
+    else:
+        content = policy_content_digest(files)
+    digest = hashlib.sha256()
+    digest.update(os.environ.get("AGENT_HARNESS_SECRET_SCAN_BUDGET", "").encode())
+    digest.update(b"\0")
+    digest.update(content.encode())
+    _POLICY_FINGERPRINT = (stamp, digest.hexdigest())
+    return _POLICY_FINGERPRINT[1]
+
+
+def policy_content_digest(files: tuple[Path, ...]) -> str:
+    """A digest of the bytes of `files`, the part of the fingerprint on disk."""
+
+    import hashlib
+
+    digest = hashlib.sha256()
+    for file in files:
+        try:
+            digest.update(file.read_bytes())
+        except OSError:
+            pass
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def guard_cache_key(
+    tool: str,
+    *,
+    command: str,
+    path: str,
+    content: str,
+    cwd: str,
+    resolver: PathResolver | None = None,
+) -> str:
+    """The cache key for one tool call, or "" when caching is off.
+
+    Keys on the resolved paths the policy would match as well as the raw
+    arguments, so repointing a symlink cannot replay an old "allow".
+    """
+
+    if GUARD_CACHE is None:
+        return ""
+    import hashlib
+
+    call = [
+        policy_fingerprint(),
+        tool.lower().strip(),
+        command,
+        path,
+        resolved_paths(
+            tool,
+            command=command,
+            path=path,
+            content=content,
+            cwd=cwd,
+            resolver=resolver,
+        ),
+        cwd,
+    ]
+    digest = hashlib.sha256(json.dumps(call).encode())
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def read_guard_cache(key: str) -> dict[str, str] | None:
+    """The cached verdict for `key`, or None on a miss, expiry, or bad entry."""
+
+    import time
+
+    entry_path = GUARD_CACHE / f"{key}.json"
+    try:
+        entry = json.loads(entry_path.read_text())
+        expires = entry.get("expires")
+        if expires is not None and time.time() >= expires:
+            return None
+        verdict = {"decision": entry["decision"], "reason": entry["reason"]}
+        if entry.get("rule"):
+            verdict["rule"] = entry["rule"]
+        # The mtime is the recency that pruning orders by.
+        os.utime(entry_path)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not all(isinstance(value, str) for value in verdict.values()):
+        return None
+    return verdict
+
+
+def write_guard_cache(
+    key: str, verdict: dict[str, str], *, ttl: float | None = None
+) -> None:
+    """Store `verdict` under `key`. Failing to cache never fails the call."""
+
+    import time
+
+    entry = {**verdict, "expires": time.time() + ttl if ttl is not None else None}
+    entry_path = GUARD_CACHE / f"{key}.json"
+    scratch = entry_path.with_name(f".{key}.{os.getpid()}.tmp")
+    try:
+        GUARD_CACHE.mkdir(mode=0o700, parents=True, exist_ok=True)
+        scratch.write_text(json.dumps(entry))
+        os.replace(scratch, entry_path)
+    except OSError:
+        return
+    # Keys are uniformly distributed, so this prunes on about one write in 16
+    # rather than listing the directory every time.
+    if key.startswith("0"):
+        prune_guard_cache()
+
+
+def prune_guard_cache() -> None:
+    """Drop the least recently used entries beyond GUARD_CACHE_ENTRIES."""
+
+    try:
+        entries = []
+        with os.scandir(GUARD_CACHE) as scan:
+            for item in scan:
+                try:
+                    entries.append((item.stat().st_mtime_ns, item.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    if len(entries) <= GUARD_CACHE_ENTRIES:
+        return
+    entries.sort()
+    for _, stale in entries[: len(entries) - GUARD_CACHE_ENTRIES]:
+        try:
+            os.unlink(stale)
+        except OSError:
+            pass
+
+
+_SAFETY_STAMP: tuple[int, int] | None = None
+# What this module takes from safety.py, rebound whenever it is reloaded.
+_SAFETY_NAMES = (
+    "PATCH_TOOLS",
+    "GuardDecision",
+    "PathResolver",
+    "consults_git",
+    "evaluate",
+    "parse_apply_patch",
+    "resolved_paths",
+)
+
+
+def refresh_safety_policy() -> None:
+    """Reload safety.py in a long-lived guard process when it changes on disk.
+
+    A one-shot `guard` reads the policy fresh every call; `guard-server` would
+    otherwise keep enforcing whatever it imported at startup. A guard running
+    from the bundle watches hooks/safety.py, and on a change imports it from
+    there in place of the bundled copy.
+    """
+
+    global _SAFETY_STAMP
+    module = sys.modules.get("safety")
+    if module is None or not getattr(module, "__file__", None):
+        return
+    source = SHARED / "hooks" / "safety.py" if GUARD_BUNDLE else Path(module.__file__)
+    try:
+        stat = source.stat()
+    except OSError:
+        return
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _SAFETY_STAMP is None:
+        _SAFETY_STAMP = stamp
+    elif stamp != _SAFETY_STAMP:
+        import importlib
+
+        if module.__file__ == str(source):
+            module = importlib.reload(module)
+        else:
+            sys.path.insert(0, str(source.parent))
+            del sys.modules["safety"]
+            module = importlib.import_module("safety")
+        globals().update({name: getattr(module, name) for name in _SAFETY_NAMES})
+        _SAFETY_STAMP = stamp
+
+
+# The parsed manifest and its suffix index, keyed by the manifest's stat stamp.
+_MANIFEST_CACHE: (
+    tuple[tuple[int, int], dict[str, dict[str, str]], dict[str, Any]] | None
+) = None
+
+
+def load_generated_manifest() -> dict[str, dict[str, str]]:
+    """Read GENERATED_MANIFEST, or return {} when it is missing or unreadable.
+
+    Fails open on purpose: a missing manifest must not wedge every write in every
+    harness. `just harness-check` is what catches the manifest going stale.
+
+    The parsed manifest is kept until the file's mtime or size changes, so a
+    long-lived `guard-server` neither re-parses it per call nor serves a stale one.
+    A current guard snapshot supplies it without parsing at all.
+    """
+
+    return _generated_manifest_and_index()[0]
+
+
+def _generated_manifest_and_index() -> tuple[dict[str, dict[str, str]], dict[str, Any]]:
+    global _MANIFEST_CACHE
+    if GUARD_BUNDLE:
+        return {}, _bundled_suffix_index()
+    try:
+        stat = GENERATED_MANIFEST.stat()
+    except OSError:
+        return {}, {}
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _MANIFEST_CACHE is not None and _MANIFEST_CACHE[0] == stamp:
+        return _MANIFEST_CACHE[1], _MANIFEST_CACHE[2]
+    # The guard snapshot carries both, parsed and indexed by `generate`.
+    snapshot = installed_snapshot()
+    recorded = snapshot["sources"].get(str(GENERATED_MANIFEST)) if snapshot else None
+    if recorded is not None and tuple(recorded) == stamp:
+        _MANIFEST_CACHE = (stamp, snapshot["manifest"], snapshot["index"])
+        return _MANIFEST_CACHE[1], _MANIFEST_CACHE[2]
+    try:
+        data = json.loads(GENERATED_MANIFEST.read_text())
+    except (OSError, ValueError):
+        return {}, {}
+    manifest = data if isinstance(data, dict) else {}
+    index = build_suffix_index(manifest)
+    _MANIFEST_CACHE = (stamp, manifest, index)
+    return manifest, index
+
+
+_BUNDLE_INDEX: dict[str, Any] | None = None
+
+
+def _bundled_suffix_index() -> dict[str, Any]:
+    """The suffix index generate stored in the bundle, or {} when unreadable."""
+
+    global _BUNDLE_INDEX
+    if _BUNDLE_INDEX is None:
+        try:
+            raw = __loader__.get_data(f"{GUARD_BUNDLE}/{GUARD_BUNDLE_INDEX}")
+            data = json.loads(raw)
+        except (OSError, ValueError):
+            data = {}
+        _BUNDLE_INDEX = data if isinstance(data, dict) else {}
+    return _BUNDLE_INDEX
+
+
+# Marks where a key ends in the suffix index. No path component contains "/",
+# so it cannot collide with one, and the index stays plain JSON for the bundle.
+_KEY_END = "/"
+
+
+def build_suffix_index(manifest: dict[str, Any]) -> dict[str, Any]:
+    """Index manifest keys by their path components, last component first.
+
+    Each node maps a component to the node for the component before it. A key
+    ends at the node reached by its first component, stored there under
+    `_KEY_END` as [manifest position, key, source]. The position lets a lookup
+    that passes several keys return the one a scan in manifest order would.
+    """
+
+    root: dict[str, Any] = {}
+    for position, (key, entry) in enumerate(manifest.items()):
+        node = root
+        for component in reversed(key.removeprefix("~/").split("/")):
+            node = node.setdefault(component, {})
+        source = entry.get("source") if isinstance(entry, dict) else None
+        node.setdefault(_KEY_END, [position, key, source or ""])
+    return root
+
+
+def lookup_generated(
+    path: str, *, cwd: str | None = None, resolver: PathResolver | None = None
+) -> tuple[str, str] | None:
+    """Return (manifest key, source) for `path`, or None when it is not generated.
+
+    A relative `path` is taken from `cwd`, as the safety rules take it, so the
+    guard judges the file the call will write and not one under its own cwd.
+
+    Matches on the tail of the path rather than on equality so that a copy of the
+    repository checked out as a worktree — where the same artifact lives under a
+    different prefix — is still recognized as generated. The walk runs over the
+    suffix index, so it costs one step per path component however many artifacts
+    the manifest lists.
+    """
+
+    _, index = _generated_manifest_and_index()
+    if not index:
+        return None
+    candidate = (resolver or PathResolver()).resolve(path, cwd)
+    best: list[Any] | None = None
+    node = index
+    for component in reversed(candidate.split("/")):
+        node = node.get(component)
+        if node is None:
+            break
+        entry = node.get(_KEY_END)
+        if entry is not None and (best is None or entry < best):
+            best = entry
+    return (best[1], best[2]) if best else None
+
+
+def generated_path_warning(
+    tool: str,
+    path: str,
+    *,
+    cwd: str | None = None,
+    resolver: PathResolver | None = None,
+) -> str:
+    """Explain why `path` must not be written, when it is a generated artifact."""
+
+    if tool.lower().strip() not in {
+        "write",
+        "edit",
+        "multiedit",
+        "file_write",
+        "file_edit",
+    }:
+        return ""
+    found = lookup_generated(path, cwd=cwd, resolver=resolver)
+    if found is None:
+        return ""
+    key, source = found
+    target = f"Edit {source} instead" if source else "Edit its source instead"
+    return (
+        f"{key} is generated by scripts/agent-harnesses.py and will be "
+        f"overwritten by the next `just harness-generate`. {target}, then "
+        "regenerate."
+    )
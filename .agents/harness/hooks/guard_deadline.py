@@ -0,0 +1,144 @@
+"""End-to-end latency budgets for shared guard calls.
+
+A guard call that never answers holds its tool call until the harness's own
+hook timeout, and what a harness does then is up to the harness, not the
+policy. Instead every call gets a budget. Each stage it passes through (the
+`guard-server` round trip, in-process evaluation, a spawned guard) spends from
+one GuardDeadline, and a call that runs out is denied and its overrun logged,
+so that budgets can be tuned from real numbers (`agent-harnesses.py
+guard-stats`).
+
+The generated wrappers import this before anything else, so it stays small.
+
+Copyright: Ben Chatelain. Apache 2.0.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Self
+
+# Seconds, end to end. Under the shortest hook timeout a harness gives the guard
+# (Codex allows 3 s), so the guard's own deny arrives first.
+DEFAULT_GUARD_BUDGET = 2.5
+
+HOME = Path(os.environ.get("HOME", str(Path.home())))
+# One NDJSON line per overrun: when, which harness, its budget, and the stage
+# that ran out. Under run/ with the other guard state, out of an agent's reach.
+GUARD_OVERRUN_LOG = HOME / ".agents" / "harness" / "run" / "guard-overruns.ndjson"
+# Past this size the log moves to `.1`, replacing the one before.
+GUARD_OVERRUN_BYTES = 1024 * 1024
+
+
+def guard_budget(harness: str) -> float:
+    """Seconds a guard call for `harness` may take before it is denied.
+
+    AGENT_HARNESS_GUARD_BUDGET_<HARNESS> sets one harness's budget and
+    AGENT_HARNESS_GUARD_BUDGET every harness's; anything but a positive number
+    is ignored.
+    """
+
+    for name in (
+        f"AGENT_HARNESS_GUARD_BUDGET_{harness.upper()}",
+        "AGENT_HARNESS_GUARD_BUDGET",
+    ):
+        try:
+            budget = float(os.environ.get(name, ""))
+        except ValueError:
+            continue
+        if budget > 0:
+            return budget
+    return DEFAULT_GUARD_BUDGET
+
+
+class DeadlineExceeded(Exception):
+    """Raised into in-process evaluation when its deadline passes."""
+
+
+class GuardDeadline:
+    """One guard call's budget, shared by every stage the call passes through.
+
+    Entered as a context manager, it arms SIGALRM for the time remaining, so
+    in-process evaluation is cut off wherever it stands: a stalled stat, a git
+    lock, or a `git` child, which subprocess kills on the way out. Off the main
+    thread no alarm can be armed, and only `expired` bounds the call.
+    """
+
+    def __init__(self, harness: str, budget: float | None = None) -> None:
+        self.harness = harness
+        self.budget = guard_budget(harness) if budget is None else budget
+        self.expires = time.monotonic() + self.budget
+        self._previous: Any = None
+        self._armed = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def overrun(self, stage: str) -> dict[str, str]:
+        """Log an overrun at `stage` and return the fail-closed verdict for it."""
+
+        record_overrun(self.harness, self.budget, stage)
+        return {
+            "decision": "deny",
+            "reason": f"shared guard failed closed: no verdict within the "
+            f"{self.budget:g} s {self.harness} budget ({stage} ran out)",
+            "rule": "guard-deadline",
+        }
+
+    def __enter__(self) -> Self:
+        import signal
+
+        def expire(signum: int, frame: Any) -> None:
+            raise DeadlineExceeded
+
+        try:
+            self._previous = signal.signal(signal.SIGALRM, expire)
+        except (AttributeError, ValueError):
+            # No SIGALRM on this platform, or not the main thread.
+            return self
+        self._armed = True
+        signal.setitimer(signal.ITIMER_REAL, max(self.remaining(), 0.001))
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if not self._armed:
+            return
+        import signal
+
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous)
+        self._armed = False
+
+
+def record_overrun(harness: str, budget: float, stage: str) -> None:
+    """Append one overrun record. Failing to log never fails the call."""
+
+    record = {
+        "ts": round(time.time(), 3),
+        "harness": harness,
+        "budget": budget,
+        "stage": stage,
+    }
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+    try:
+        GUARD_OVERRUN_LOG.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # One O_APPEND write per record, so concurrent guards never interleave.
+        fd = os.open(GUARD_OVERRUN_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            full = os.fstat(fd).st_size >= GUARD_OVERRUN_BYTES
+        finally:
+            os.close(fd)
+        if full:
+            os.replace(GUARD_OVERRUN_LOG, f"{GUARD_OVERRUN_LOG}.1")
+    except OSError:
+        return
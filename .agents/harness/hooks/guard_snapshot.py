@@ -0,0 +1,194 @@
+"""Precompiled guard state, written by `generate` and read by every guard call.
+
+A one-shot guard pays to compile safety.py and guard_client.py from source
+(no hook path writes bytecode, and zipimport never caches it), then to parse
+generated-paths.json into its suffix index and hash the policy for the verdict
+cache. None of that changes between runs of `generate`, so `generate` does it
+once and marshals the result into GUARD_SNAPSHOT: the modules' code objects,
+the manifest and its index, and the policy digest.
+
+A guard loads the snapshot with one read. It is used only when its header
+names this interpreter and every source it was built from still has the
+recorded mtime and size; anything else, including a snapshot another user
+could have written, falls back to importing from source.
+
+The snapshot is marshalled code for this machine's interpreter, so it lives
+under run/ with the other local guard state rather than in the repository.
+
+Copyright: Ben Chatelain. Apache 2.0.
+"""
+
+from __future__ import annotations
+
+import marshal
+import os
+import sys
+from pathlib import Path
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any
+
+HOME = Path(os.environ.get("HOME", str(Path.home()))).resolve()
+SHARED = HOME / ".agents" / "harness"
+HOOKS = SHARED / "hooks"
+GENERATED_MANIFEST = SHARED / "generated-paths.json"
+# Control plane, like the verdict cache: the snapshot holds code the guard runs.
+GUARD_SNAPSHOT = SHARED / "run" / "guard-snapshot.marshal"
+# Bump when the layout of the marshalled record changes.
+SNAPSHOT_FORMAT = 1
+# In import order: each may import only those before it.
+SNAPSHOT_MODULES = ("guard_deadline", "safety", "guard_client")
+
+_INSTALLED: dict[str, Any] | None = None
+
+
+def snapshot_header() -> bytes:
+    """The first line of a snapshot this interpreter can load.
+
+    marshal's format is private to a Python version, so the header pins the
+    exact build as well as the record layout.
+    """
+
+    build = f"{sys.implementation.cache_tag} {sys.hexversion:x}"
+    return f"agent-harness guard snapshot {SNAPSHOT_FORMAT} {build}\n".encode()
+
+
+def snapshot_sources() -> dict[str, Path]:
+    """Every file a snapshot is built from, by the name it is recorded under."""
+
+    sources = {name: HOOKS / f"{name}.py" for name in SNAPSHOT_MODULES}
+    sources["manifest"] = GENERATED_MANIFEST
+    return sources
+
+
+def source_stamp(path: Path) -> tuple[int, int]:
+    """(mtime_ns, size) for `path`, or (0, -1) when it cannot be read."""
+
+    try:
+        stat = path.stat()
+    except OSError:
+        return (0, -1)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def write_snapshot(path: Path = GUARD_SNAPSHOT) -> Path:
+    """Compile the guard and write its snapshot to `path`, atomically.
+
+    Each source is stamped before it is read, so one edited mid-build leaves a
+    snapshot that no longer validates rather than one that lies.
+    """
+
+    import json
+
+    from guard_client import build_suffix_index, policy_content_digest  # type: ignore
+
+    sources = snapshot_sources()
+    stamps = {name: source_stamp(source) for name, source in sources.items()}
+    modules = {
+        name: compile(sources[name].read_bytes(), str(sources[name]), "exec")
+        for name in SNAPSHOT_MODULES
+    }
+    try:
+        manifest = json.loads(GENERATED_MANIFEST.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+    if not isinstance(manifest, dict):
+        manifest = {}
+    record = {
+        "sources": {str(sources[name]): stamp for name, stamp in stamps.items()},
+        "modules": modules,
+        "manifest": manifest,
+        "index": build_suffix_index(manifest),
+        "digest": policy_content_digest(
+            (sources["safety"], GENERATED_MANIFEST, sources["guard_client"])
+        ),
+    }
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    scratch = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    fd = os.open(scratch, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as out:
+        out.write(snapshot_header())
+        marshal.dump(record, out)
+    os.replace(scratch, path)
+    return path
+
+
+def load_snapshot(path: Path = GUARD_SNAPSHOT) -> dict[str, Any] | None:
+    """The snapshot at `path` when it is current for this interpreter, else None."""
+
+    try:
+        with open(path, "rb") as snapshot:
+            stat = os.fstat(snapshot.fileno())
+            # Code from a file anyone else could have written is not run.
+            if stat.st_uid != os.geteuid() or stat.st_mode & 0o022:
+                return None
+            data = snapshot.read()
+    except OSError:
+        return None
+    header = snapshot_header()
+    if not data.startswith(header):
+        return None
+    try:
+        record = marshal.loads(data[len(header) :])
+        sources = record["sources"]
+        if not isinstance(record["modules"], dict):
+            return None
+    except (ValueError, EOFError, TypeError, KeyError):
+        return None
+    for source, stamp in sources.items():
+        if source_stamp(Path(source)) != tuple(stamp):
+            return None
+    return record
+
+
+def install_snapshot(path: Path = GUARD_SNAPSHOT) -> bool:
+    """Serve the guard modules from a current snapshot, if there is one.
+
+    Registers a finder ahead of the path-based ones, so the next `import
+    guard_client` runs the precompiled code with `__file__` still pointing at
+    the source in HOOKS. Modules already imported are left alone, and a source
+    edited since is imported from disk, which is how `guard-server` reloads
+    safety.py. Returns whether the snapshot was installed.
+    """
+
+    global _INSTALLED
+    if _INSTALLED is not None:
+        return True
+    record = load_snapshot(path)
+    if record is None:
+        return False
+    from importlib.machinery import ModuleSpec
+
+    class SnapshotFinder:
+        @staticmethod
+        def find_spec(name: str, target_path: Any = None, target: Any = None) -> Any:
+            code = record["modules"].get(name)
+            if code is None:
+                return None
+            stamp = record["sources"].get(code.co_filename)
+            if stamp is None or source_stamp(Path(code.co_filename)) != tuple(stamp):
+                return None
+            spec = ModuleSpec(name, SnapshotLoader(code), origin=code.co_filename)
+            spec.has_location = True
+            return spec
+
+    class SnapshotLoader:
+        def __init__(self, code: Any) -> None:
+            self.code = code
+
+        def create_module(self, spec: Any) -> None:
+            return None
+
+        def exec_module(self, module: Any) -> None:
+            exec(self.code, module.__dict__)  # noqa: S102 - validated snapshot code
+
+    sys.meta_path.insert(0, SnapshotFinder)
+    _INSTALLED = record
+    return True
+
+
+def installed_snapshot() -> dict[str, Any] | None:
+    """The snapshot install_snapshot() put in place, or None."""
+
+    return _INSTALLED
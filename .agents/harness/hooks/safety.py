@@ -8,115 +8,567 @@ from __future__ import annotations
 
 import os
 import re
-import subprocess
 from dataclasses import dataclass
 from pathlib import Path
 
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from typing import Any
+
 
 @dataclass(frozen=True)
 class GuardDecision:
     decision: str
     reason: str = ""
+    # Stable id of the rule that decided, for telemetry; "" for a plain allow.
+    rule: str = ""
 
     @property
     def allowed(self) -> bool:
         return self.decision in {"allow", "warn"}
 
 
-PRIVILEGE_ESCALATION = re.compile(
-    r"(^|;|&&|\|\||\||\n|\r|\$\(|`)\s*(sudo|su|doas|pkexec)\b",
-    re.IGNORECASE,
-)
+# The policy's regexes are compiled in groups, each on first use, by the tool
+# class that needs it: a `write` never compiles the command rules, a `bash`
+# never compiles SECRET_CONTENT, and `git status` compiles only the shell
+# gates. Inside this module, call _require(group) before touching a group's
+# names; from outside, `safety.NAME` loads the group through __getattr__.
+_LOADED_GROUPS: set[str] = set()
+
+
+def _require(group: str) -> None:
+    if group not in _LOADED_GROUPS:
+        _RULE_GROUPS[group]()
+        _LOADED_GROUPS.add(group)
+
+
+def __getattr__(name: str) -> Any:
+    for group, names in _RULE_GROUP_NAMES.items():
+        if name in names:
+            _require(group)
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+PRIVILEGE_ESCALATION: re.Pattern[str]
+DANGEROUS_COMMANDS: tuple[tuple[str, re.Pattern[str]], ...]
+OBFUSCATED_EXECUTION: tuple[tuple[str, re.Pattern[str]], ...]
+COMMAND_RULES: tuple[tuple[str, str, re.Pattern[str]], ...]
+_COMMAND_RULES_COMBINED: re.Pattern[str]
+
+
+def _compile_command_rules() -> None:
+    global PRIVILEGE_ESCALATION, DANGEROUS_COMMANDS, OBFUSCATED_EXECUTION
+    global COMMAND_RULES, _COMMAND_RULES_COMBINED
 
-DANGEROUS_COMMANDS = (
-    re.compile(
-        r"\brm\s+-(?=[A-Za-z-]*r)(?=[A-Za-z-]*f)[A-Za-z-]*\s+(/|~|\*|\.\.)",
+    PRIVILEGE_ESCALATION = re.compile(
+        r"(^|;|&&|\|\||\||\n|\r|\$\(|`)\s*(sudo|su|doas|pkexec)\b",
         re.IGNORECASE,
-    ),
-    re.compile(r">\s*/dev/sd[a-z]?", re.IGNORECASE),
-    re.compile(r"\bmkfs(\.|\s)", re.IGNORECASE),
-    re.compile(r"\bdd\s+if=.*\s+of=/dev/", re.IGNORECASE),
-    re.compile(r"\bchmod\s+(-R\s+)?777\b", re.IGNORECASE),
-    re.compile(r"\bchmod\s+\+s\b", re.IGNORECASE),
-    re.compile(r":\(\)\{.*:\|:&\};", re.IGNORECASE),
-    re.compile(r"\b(curl|wget)\b[^|]*\|\s*(ba)?sh\b", re.IGNORECASE),
-    re.compile(r"\b(truncate|shred)\b", re.IGNORECASE),
-)
+    )
 
-OBFUSCATED_EXECUTION = (
-    re.compile(r"\beval\s+.*\$", re.IGNORECASE),
-    re.compile(r"\bbase64\s+-d.*\|\s*(ba)?sh\b", re.IGNORECASE),
-    re.compile(r"\bawk\s+.*system\s*\(", re.IGNORECASE),
-    re.compile(r"\bbash\s+<\(", re.IGNORECASE),
-)
+    # Command rules as (id, pattern). Ids are stable: they name the rule in a
+    # decision without quoting the regex back.
+    DANGEROUS_COMMANDS = (
+        (
+            "rm-recursive-force",
+            re.compile(
+                r"\brm\s+-(?=[A-Za-z-]*r)(?=[A-Za-z-]*f)[A-Za-z-]*\s+(/|~|\*|\.\.)",
+                re.IGNORECASE,
+            ),
+        ),
+        ("redirect-to-disk", re.compile(r">\s*/dev/sd[a-z]?", re.IGNORECASE)),
+        ("mkfs", re.compile(r"\bmkfs(\.|\s)", re.IGNORECASE)),
+        ("dd-to-device", re.compile(r"\bdd\s+if=.*\s+of=/dev/", re.IGNORECASE)),
+        ("chmod-777", re.compile(r"\bchmod\s+(-R\s+)?777\b", re.IGNORECASE)),
+        ("chmod-setuid", re.compile(r"\bchmod\s+\+s\b", re.IGNORECASE)),
+        ("fork-bomb", re.compile(r":\(\)\{.*:\|:&\};", re.IGNORECASE)),
+        (
+            "pipe-to-shell",
+            re.compile(r"\b(curl|wget)\b[^|]*\|\s*(ba)?sh\b", re.IGNORECASE),
+        ),
+        ("truncate-shred", re.compile(r"\b(truncate|shred)\b", re.IGNORECASE)),
+    )
+
+    OBFUSCATED_EXECUTION = (
+        ("eval-expansion", re.compile(r"\beval\s+.*\$", re.IGNORECASE)),
+        (
+            "base64-to-shell",
+            re.compile(r"\bbase64\s+-d.*\|\s*(ba)?sh\b", re.IGNORECASE),
+        ),
+        ("awk-system", re.compile(r"\bawk\s+.*system\s*\(", re.IGNORECASE)),
+        ("bash-process-sub", re.compile(r"\bbash\s+<\(", re.IGNORECASE)),
+    )
+
+    # Every command rule, in the order it takes precedence, as (id, reason,
+    # pattern).
+    COMMAND_RULES = (
+        ("privilege-escalation", "Privilege escalation blocked", PRIVILEGE_ESCALATION),
+        *(
+            (f"dangerous.{name}", "Dangerous command pattern detected", pattern)
+            for name, pattern in DANGEROUS_COMMANDS
+        ),
+        *(
+            (f"obfuscated.{name}", "Obfuscated execution pattern detected", pattern)
+            for name, pattern in OBFUSCATED_EXECUTION
+        ),
+    )
 
-PROTECTED_PATHS = re.compile(
-    r"("
-    r"\.env($|\.)|"
-    r"\.ssh/|"
-    r"id_(rsa|ed25519|ecdsa)|"
-    r"\.pem$|\.key$|\.p12$|\.pfx$|\.jks$|"
-    r"\.aws/credentials|"
-    r"\.docker/config\.json|"
-    r"kubeconfig|"
-    r"\.npmrc$|\.pypirc$|\.netrc$|\.pgpass$|\.htpasswd$|\.git-credentials|"
-    r"\.claude/\.credentials\.json|"
-    r"\.codex/auth\.json|"
-    r"\.omp/agent/agent\.db|"
-    r"\.omp/agent/secrets\.yml|"
-    r"\.pi/agent/auth\.json|"
-    r"\.gemini/google_accounts\.json|"
-    r"\.gemini/oauth_creds\.json|"
-    r"\.gemini/antigravity-cli/installation_id|"
-    r"\.gemini/antigravity-cli/conversations/|"
-    r"\.cursor/ai-tracking/|"
-    r"\.grok/auth\.json|\.grok/mcp_credentials\.json"
-    r")",
-    re.IGNORECASE,
+    # One scan for all of COMMAND_RULES. Each rule sits in a named group, so the
+    # match says which one fired.
+    _COMMAND_RULES_COMBINED = re.compile(
+        "|".join(
+            f"(?P<rule{index}>{pattern.pattern})"
+            for index, (_, _, pattern) in enumerate(COMMAND_RULES)
+        ),
+        re.IGNORECASE,
+    )
+
+
+# Literals at least one of which every command rule and every write-target
+# construct below needs in order to match. Most agent commands (`git status`,
+# `rg`, `ls`) contain none, and for those no rule here runs at all. Add
+# to this whenever a rule is added that none of these words would catch, or
+# the rule will never fire.
+_TRIGGER_LITERALS = (
+    # COMMAND_RULES
+    "su",
+    "doas",
+    "pkexec",
+    "rm",
+    "/dev/sd",
+    "mkfs",
+    "of=/dev/",
+    "chmod",
+    ":(){",
+    "curl",
+    "wget",
+    "truncate",
+    "shred",
+    "eval",
+    "base64",
+    "awk",
+    "<(",
+    # candidate_write_targets
+    ">",
+    "mv",
+    "cp",
+    "tee",
+    "ln",
+    "install",
+    "unlink",
+    "touch",
+    "chown",
+    "sed",
+    "of=",
 )
 
+_TRIGGERS: re.Pattern[str]
+_REWRITTEN_WORDS: re.Pattern[str]
+_GIT_COMMIT: re.Pattern[str]
+
+
+def _compile_shell_gates() -> None:
+    global _TRIGGERS, _REWRITTEN_WORDS, _GIT_COMMIT
+
+    # A regex rather than `in` checks so the literals fold case exactly the way
+    # the IGNORECASE rules they stand in for do.
+    _TRIGGERS = re.compile("|".join(map(re.escape, _TRIGGER_LITERALS)), re.IGNORECASE)
+    # What lets a command word differ from its text: an expansion, a
+    # substitution, quoting, or an escape. `$CMD f` and `c''p a f` name a
+    # writer without spelling one, so the write-target lexer has to read them.
+    _REWRITTEN_WORDS = re.compile(r"[$`'\"\\]")
+    _GIT_COMMIT = re.compile(r"^\s*(git\s+commit|git\s+-C\s+\S+\s+commit)\b")
+
+
+@dataclass(frozen=True)
+class PathRule:
+    """One path rule, matched against a resolved path with case folded.
+
+    `literal` may start anywhere in the path, as a substring would. `end` says
+    what has to follow it: "" anything, "$" the end of the path, and "name"
+    anything but a name character (`[\\w.-]`), so that `/agent_plugins.py`
+    matches that file and not `agent_plugins.pyc` beside it. A literal ending
+    in "/" names a directory and matches everything under it.
+    """
+
+    rule: str
+    literal: str
+    end: str = ""
+
+    @property
+    def family(self) -> str:
+        """The rule id up to its first dot, which decisions are reported under."""
+
+        return self.rule.partition(".")[0]
+
+
 # The control plane: the files that decide what this policy permits. An agent
 # able to edit these can switch off every other rule here — including the
-# protected-path list above — and the first time the guard blocks something it
-# will have a plausible reason to try. Keep them human-only: edit by hand.
+# protected paths ahead of them — and the first time the guard blocks something
+# it will have a plausible reason to try. Keep them human-only: edit by hand.
 #
-# Deliberately narrow. Broad entries like `config\.yml$` or `\.gitignore$` would
+# Deliberately narrow. Broad entries like `config.yml` or `.gitignore` would
 # block routine agent work across every repository, and the cost of that lands
 # on every session, not just on a self-improvement loop.
 #
-# Fragments end with a non-path lookahead rather than `$` so the same pattern
-# matches both a bare path and a path embedded in a shell command.
-_CONTROL_PLANE_FRAGMENTS = (
-    r"/\.agents/harness/hooks/",
-    r"/\.agents/harness/self-improve-policy\.json(?![\w.-])",
+# Rules end with "name" rather than "$" so the same rule matches both a bare
+# path and a path embedded in a shell command.
+_CONTROL_PLANE_RULES = (
+    PathRule("control-plane-path.hooks", "/.agents/harness/hooks/"),
+    PathRule(
+        "control-plane-path.self-improve-policy",
+        "/.agents/harness/self-improve-policy.json",
+        "name",
+    ),
     # The generated-path manifest is the whole basis of the generated-file deny
     # rule, and load_generated_manifest() fails open. Blanking this file would
     # silently unlock all 274 generated artifacts, so it is control plane too.
-    r"/\.agents/harness/generated-paths\.json(?![\w.-])",
-    r"/scripts/agent-harnesses\.py(?![\w.-])",
-    r"/scripts/agent_plugins\.py(?![\w.-])",
-    r"/harness-guard\.(?:ts|py)(?![\w.-])",
-    r"/(?:write|bash)-guard\.sh(?![\w.-])",
+    PathRule(
+        "control-plane-path.generated-paths",
+        "/.agents/harness/generated-paths.json",
+        "name",
+    ),
+    # Where `guard-server` listens. Whatever answers on that socket decides every
+    # verdict for the clients that use it.
+    PathRule("control-plane-path.guard-run", "/.agents/harness/run/"),
+    PathRule("control-plane-path.generator", "/scripts/agent-harnesses.py", "name"),
+    PathRule("control-plane-path.generator", "/scripts/agent_plugins.py", "name"),
+    PathRule("control-plane-path.guard-wrapper", "/harness-guard.ts", "name"),
+    PathRule("control-plane-path.guard-wrapper", "/harness-guard.py", "name"),
+    PathRule("control-plane-path.codex-hook", "/write-guard.sh", "name"),
+    PathRule("control-plane-path.codex-hook", "/bash-guard.sh", "name"),
 )
 
-CONTROL_PLANE_PATHS = re.compile(
-    "(?:" + "|".join(_CONTROL_PLANE_FRAGMENTS) + ")",
-    re.IGNORECASE,
+# Every path rule, in the order it takes precedence: a path both protected and
+# control plane is reported as protected.
+PATH_RULES: tuple[PathRule, ...] = (
+    PathRule("protected-path.env", ".env", "$"),
+    PathRule("protected-path.env", ".env."),
+    PathRule("protected-path.ssh", ".ssh/"),
+    PathRule("protected-path.ssh-key", "id_rsa"),
+    PathRule("protected-path.ssh-key", "id_ed25519"),
+    PathRule("protected-path.ssh-key", "id_ecdsa"),
+    *(
+        PathRule(f"protected-path.{suffix}", f".{suffix}", "$")
+        for suffix in ("pem", "key", "p12", "pfx", "jks")
+    ),
+    PathRule("protected-path.aws", ".aws/credentials"),
+    PathRule("protected-path.docker", ".docker/config.json"),
+    PathRule("protected-path.kubeconfig", "kubeconfig"),
+    *(
+        PathRule(f"protected-path.{name}", f".{name}", "$")
+        for name in ("npmrc", "pypirc", "netrc", "pgpass", "htpasswd")
+    ),
+    PathRule("protected-path.git-credentials", ".git-credentials"),
+    PathRule("protected-path.claude", ".claude/.credentials.json"),
+    PathRule("protected-path.codex", ".codex/auth.json"),
+    PathRule("protected-path.omp", ".omp/agent/agent.db"),
+    PathRule("protected-path.omp", ".omp/agent/secrets.yml"),
+    PathRule("protected-path.pi", ".pi/agent/auth.json"),
+    PathRule("protected-path.gemini", ".gemini/google_accounts.json"),
+    PathRule("protected-path.gemini", ".gemini/oauth_creds.json"),
+    PathRule("protected-path.antigravity", ".gemini/antigravity-cli/installation_id"),
+    PathRule("protected-path.antigravity", ".gemini/antigravity-cli/conversations/"),
+    PathRule("protected-path.cursor", ".cursor/ai-tracking/"),
+    PathRule("protected-path.grok", ".grok/auth.json"),
+    PathRule("protected-path.grok", ".grok/mcp_credentials.json"),
+    *_CONTROL_PLANE_RULES,
 )
 
-SECRET_CONTENT = re.compile(
-    r"("
-    r"AKIA[0-9A-Z]{16}|"
-    r"sk-[A-Za-z0-9_-]{20,}|"
-    r"ghp_[A-Za-z0-9]{36}|"
-    r"gho_[A-Za-z0-9]{36}|"
-    r"glpat-[A-Za-z0-9_-]{20,}|"
-    r"xox[bpoas]-[A-Za-z0-9-]+|"
-    r"-----BEGIN (RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----|"
-    r"password\s*[:=]\s*[\"'][^\"']{8,}[\"']"
-    r")",
-    re.IGNORECASE,
-)
+# The deny reason for each family of path rule; "{path}" is the path as the
+# call named it.
+PATH_RULE_REASONS = {
+    "protected-path": "protected file blocked: {path}",
+    "control-plane-path": "control-plane file is human-only: {path}. It decides "
+    "what the guard permits, so edit it directly rather than through an agent.",
+}
+
+
+def _is_name_char(char: str) -> bool:
+    # What `[\w.-]` matches in a str pattern.
+    return char.isalnum() or char in "_.-"
+
+
+class _PathNode:
+    """A component trie node: the rules whose last part follows this point,
+    keyed by that part's length and then the part, and the exact components
+    that lead deeper."""
+
+    def __init__(self) -> None:
+        self.children: dict[str, _PathNode] = {}
+        self.ends: dict[int, dict[str, list[tuple[int, str]]]] = {}
+
+
+class PathClassifier:
+    """Path rules as lookups over a path's components rather than one regex.
+
+    A regex alternation tries every rule at every character of the path. Here
+    each rule is filed by its literal split at "/": a rule with no "/" goes in
+    a hashed suffix set (for "$") or is a plain substring; any other is entered
+    at a component that ends in its first part, looked up by that component's
+    tail at each length in use, or at any component when it starts with "/".
+    Its middle parts are whole components in a trie, and its last part a
+    prefix of the component after them. Classifying walks the components once,
+    so the cost grows with the path and the number of distinct lengths, not
+    with the number of rules.
+    """
+
+    def __init__(self, rules: Iterable[PathRule]) -> None:
+        self.rules = tuple(rules)
+        self._suffixes: dict[int, dict[str, int]] = {}
+        self._substrings: list[tuple[str, str, int]] = []
+        self._entries: dict[int, dict[str, _PathNode]] = {}
+        self._anywhere = _PathNode()
+        for index, rule in enumerate(self.rules):
+            self._add(index, rule)
+
+    def _add(self, index: int, rule: PathRule) -> None:
+        if rule.end not in {"", "$", "name"}:
+            raise ValueError(f"{rule.rule}: unknown end {rule.end!r}")
+        literal = rule.literal.lower()
+        first, *rest = literal.split("/")
+        if not rest:
+            if not literal:
+                raise ValueError(f"{rule.rule}: empty literal")
+            if rule.end == "$":
+                suffixes = self._suffixes.setdefault(len(literal), {})
+                suffixes.setdefault(literal, index)
+            else:
+                self._substrings.append((literal, rule.end, index))
+            return
+        *middle, last = rest
+        if not last and rule.end:
+            raise ValueError(f"{rule.rule}: a directory rule takes no end")
+        if first:
+            entries = self._entries.setdefault(len(first), {})
+            node = entries.setdefault(first, _PathNode())
+        else:
+            node = self._anywhere
+        for part in middle:
+            node = node.children.setdefault(part, _PathNode())
+        ends = node.ends.setdefault(len(last), {})
+        ends.setdefault(last, []).append((index, rule.end))
+
+    def classify(self, path: str) -> PathRule | None:
+        """The first rule, in table order, that matches `path`; else None."""
+
+        lowered = path.lower()
+        best = len(self.rules)
+        for length, suffixes in self._suffixes.items():
+            best = min(best, suffixes.get(lowered[-length:], best))
+        for literal, end, index in self._substrings:
+            if index < best and _contains(lowered, literal, end):
+                best = index
+        parts = lowered.split("/")
+        # A rule with a "/" needs a component after the one it enters at.
+        for position in range(len(parts) - 1):
+            best = self._walk(self._anywhere, parts, position + 1, best)
+            part = parts[position]
+            for length, entries in self._entries.items():
+                node = entries.get(part[-length:])
+                if node is not None:
+                    best = self._walk(node, parts, position + 1, best)
+        return self.rules[best] if best < len(self.rules) else None
+
+    @staticmethod
+    def _walk(node: _PathNode, parts: list[str], position: int, best: int) -> int:
+        """`best`, lowered to any rule matching parts[position:] from `node`."""
+
+        while position < len(parts):
+            part = parts[position]
+            for length, ends in node.ends.items():
+                for index, end in ends.get(part[:length], ()):
+                    if index >= best:
+                        continue
+                    if end == "$":
+                        matched = length == len(part) and position == len(parts) - 1
+                    elif end == "name":
+                        matched = length == len(part) or not _is_name_char(part[length])
+                    else:
+                        matched = True
+                    if matched:
+                        best = index
+            child = node.children.get(part)
+            if child is None:
+                break
+            node = child
+            position += 1
+        return best
+
+
+def _contains(text: str, literal: str, end: str) -> bool:
+    start = text.find(literal)
+    while start >= 0:
+        after = start + len(literal)
+        if not end or after == len(text) or not _is_name_char(text[after]):
+            return True
+        start = text.find(literal, start + 1)
+    return False
+
+
+def path_rule_pattern(rules: Iterable[PathRule]) -> re.Pattern[str]:
+    """`rules` as the equivalent regex alternation, for callers that want one."""
+
+    tails = {"": "", "$": "$", "name": r"(?![\w.-])"}
+    return re.compile(
+        "(?:" + "|".join(re.escape(r.literal) + tails[r.end] for r in rules) + ")",
+        re.IGNORECASE,
+    )
+
+
+PATH_CLASSIFIER: PathClassifier
+PROTECTED_PATHS: re.Pattern[str]
+CONTROL_PLANE_PATHS: re.Pattern[str]
+
+
+def _compile_path_rules() -> None:
+    global PATH_CLASSIFIER
+
+    PATH_CLASSIFIER = PathClassifier(PATH_RULES)
+
+
+def _compile_path_patterns() -> None:
+    global PROTECTED_PATHS, CONTROL_PLANE_PATHS
+
+    # The regex form of the same rules. Decisions go through PATH_CLASSIFIER;
+    # these are for callers that want a pattern to search with.
+    PROTECTED_PATHS = path_rule_pattern(
+        rule for rule in PATH_RULES if rule.family == "protected-path"
+    )
+    CONTROL_PLANE_PATHS = path_rule_pattern(_CONTROL_PLANE_RULES)
+
+
+def classify_path(path: str) -> PathRule | None:
+    """The path rule that decides a write to the resolved `path`, or None."""
+
+    _require("paths")
+    return PATH_CLASSIFIER.classify(path)
+
+
+def _path_rule_decision(rule: PathRule, path: str) -> GuardDecision:
+    reason = PATH_RULE_REASONS[rule.family].replace("{path}", path)
+    return GuardDecision("deny", reason, rule.family)
+
+
+# Every alternative has a bounded length, so a match never spans more than
+# _SECRET_SPAN characters and content can be scanned in overlapping windows.
+# Open-ended tails are cut to the shortest run that still decides a match (an
+# `sk-` key is a key after 20 characters, whatever follows); only the password
+# rule is actually capped, at whitespace and values no real password exceeds.
+# The leading lookahead names every first character an alternative can start
+# with; it lets the engine skip other positions without trying each branch.
+SECRET_CONTENT: re.Pattern[str]
+_SECRET_CONTENT_BYTES: re.Pattern[bytes]
+
+
+def _compile_secret_rules() -> None:
+    global SECRET_CONTENT, _SECRET_CONTENT_BYTES
+
+    SECRET_CONTENT = re.compile(
+        r"(?=[agpsx-])("
+        r"AKIA[0-9A-Z]{16}|"
+        r"sk-[A-Za-z0-9_-]{20}|"
+        r"ghp_[A-Za-z0-9]{36}|"
+        r"gho_[A-Za-z0-9]{36}|"
+        r"glpat-[A-Za-z0-9_-]{20}|"
+        r"xox[bpoas]-[A-Za-z0-9-]|"
+        r"-----BEGIN (RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----|"
+        r"password\s{0,64}[:=]\s{0,64}[\"'][^\"']{8,1024}[\"']"
+        r")",
+        re.IGNORECASE,
+    )
+    _SECRET_CONTENT_BYTES = re.compile(SECRET_CONTENT.pattern.encode(), re.IGNORECASE)
+
+
+_SECRET_SPAN = 1200
+# Content is scanned this much at a time; each window also reads _SECRET_SPAN
+# past its end so that a secret straddling the boundary is still whole.
+_SECRET_WINDOW = 256 * 1024
+# Content longer than this is denied unscanned rather than scanned in part.
+DEFAULT_SECRET_SCAN_BUDGET = 16 * 1024 * 1024
+
+
+def _secret_scan_budget() -> int:
+    """AGENT_HARNESS_SECRET_SCAN_BUDGET when it is a positive integer.
+
+    Read at import, so anything else falls back to the default instead of
+    taking the whole guard down with it.
+    """
+
+    try:
+        budget = int(os.environ.get("AGENT_HARNESS_SECRET_SCAN_BUDGET", ""))
+    except ValueError:
+        return DEFAULT_SECRET_SCAN_BUDGET
+    return budget if budget > 0 else DEFAULT_SECRET_SCAN_BUDGET
+
+
+SECRET_SCAN_BUDGET = _secret_scan_budget()
+SECRET_CONTENT_REASON = "secret-like content detected"
+
+
+COMMAND_TOOLS = frozenset({"bash", "shell", "exec"})
+WRITE_TOOLS = frozenset({"write", "edit", "file_write", "file_edit"})
+PATCH_TOOLS = frozenset({"apply_patch"})
+
+
+def export_rules() -> dict[str, Any]:
+    """The rules a guard not written in Python can run itself, as plain data.
+
+    Regexes go by source and flags ("i" for IGNORECASE), each list in the order
+    its rules take precedence; path rules go as PathRule fields. The rest of
+    the policy (the write targets of a shell command, repository state) is not
+    exported, and an evaluator that needs it hands the call to a Python guard.
+    """
+
+    for group in ("shell", "command", "secrets"):
+        _require(group)
+
+    def regex(pattern: re.Pattern[str]) -> dict[str, str]:
+        flags = "i" if pattern.flags & re.IGNORECASE else ""
+        return {"source": pattern.pattern, "flags": flags}
+
+    return {
+        "tools": {
+            "command": sorted(COMMAND_TOOLS),
+            "write": sorted(WRITE_TOOLS),
+            "patch": sorted(PATCH_TOOLS),
+        },
+        "triggers": list(_TRIGGER_LITERALS),
+        "rewritten_words": regex(_REWRITTEN_WORDS),
+        "git_commit": regex(_GIT_COMMIT),
+        "command": [
+            {
+                "id": rule,
+                "category": rule.partition(".")[0],
+                "decision": "deny",
+                "reason": reason,
+                **regex(pattern),
+            }
+            for rule, reason, pattern in COMMAND_RULES
+        ],
+        "paths": [
+            {
+                "id": rule.rule,
+                "family": rule.family,
+                "decision": "deny",
+                "literal": rule.literal,
+                "end": rule.end,
+            }
+            for rule in PATH_RULES
+        ],
+        "path_reasons": dict(PATH_RULE_REASONS),
+        "secrets": {
+            "id": "secret-content",
+            "decision": "deny",
+            "reason": SECRET_CONTENT_REASON,
+            **regex(SECRET_CONTENT),
+        },
+        "secret_scan_budget": {
+            "default": DEFAULT_SECRET_SCAN_BUDGET,
+            "env": "AGENT_HARNESS_SECRET_SCAN_BUDGET",
+        },
+    }
 
 
 def evaluate(
@@ -126,137 +578,1008 @@ def evaluate(
     path: str = "",
     content: str = "",
     cwd: str | None = None,
+    resolver: PathResolver | None = None,
+    git_state: GitSnapshot | None = None,
 ) -> GuardDecision:
-    """Evaluate a normalized tool call against the shared safety policy."""
+    """Evaluate a normalized tool call against the shared safety policy.
 
+    Relative paths resolve against `cwd`. Pass a `resolver` to share path
+    resolutions with other calls, and a `git_state` to share repository reads;
+    by default each call gets its own.
+    """
+
+    resolver = resolver or PathResolver()
     normalized_tool = tool.lower().strip()
-    if normalized_tool in {"bash", "shell", "exec"}:
-        return evaluate_command(command, cwd=cwd)
-    if normalized_tool in {"write", "edit", "file_write", "file_edit"}:
-        return evaluate_write(path=path, content=content)
+    if normalized_tool in COMMAND_TOOLS:
+        return evaluate_command(
+            command, cwd=cwd, resolver=resolver, git_state=git_state
+        )
+    if normalized_tool in WRITE_TOOLS:
+        return evaluate_write(path=path, content=content, cwd=cwd, resolver=resolver)
+    if normalized_tool in PATCH_TOOLS:
+        return evaluate_patch(command or content, cwd=cwd, resolver=resolver)
     return GuardDecision("allow")
 
 
-def evaluate_command(command: str, *, cwd: str | None = None) -> GuardDecision:
-    if not command.strip():
-        return GuardDecision("allow")
+def evaluate_many(
+    calls: Iterable[Mapping[str, Any]],
+    *,
+    cwd: str | None = None,
+    stop_at_deny: bool = False,
+) -> list[GuardDecision]:
+    """Evaluate normalized tool calls in order, one decision per call.
 
-    if PRIVILEGE_ESCALATION.search(command):
-        return GuardDecision("deny", "Privilege escalation blocked")
+    Each call maps `evaluate`'s arguments: `tool`, and optionally `command`,
+    `path`, `content`, and `cwd`, which defaults to `cwd`. The calls share one
+    PathResolver and one GitSnapshot, so a multi-file patch or a replayed
+    session resolves each path and reads each repository once. With
+    `stop_at_deny`, the first deny is the last decision returned.
+    """
 
-    if any(pattern.search(command) for pattern in DANGEROUS_COMMANDS):
-        return GuardDecision("deny", "Dangerous command pattern detected")
+    resolver = PathResolver()
+    git_state = GitSnapshot()
+    decisions: list[GuardDecision] = []
+    for call in calls:
+        decision = evaluate(
+            call.get("tool") or "",
+            command=call.get("command") or "",
+            path=call.get("path") or "",
+            content=call.get("content") or "",
+            cwd=call.get("cwd") or cwd,
+            resolver=resolver,
+            git_state=git_state,
+        )
+        decisions.append(decision)
+        if stop_at_deny and not decision.allowed:
+            break
+    return decisions
 
-    if any(pattern.search(command) for pattern in OBFUSCATED_EXECUTION):
-        return GuardDecision("deny", "Obfuscated execution pattern detected")
 
-    # Path rules have to apply here too, not just in evaluate_write: `echo x >>
-    # safety.py` reaches the same file as a write tool, and until this existed
-    # one line of shell switched off every path rule in this module.
-    target = writes_to(command, PROTECTED_PATHS)
-    if target:
-        return GuardDecision("deny", f"protected file blocked: {target}")
+def resolved_paths(
+    tool: str,
+    *,
+    command: str = "",
+    path: str = "",
+    content: str = "",
+    cwd: str | None = None,
+    resolver: PathResolver | None = None,
+) -> list[str]:
+    """The resolved paths a decision on this tool call can turn on.
 
-    target = writes_to(command, CONTROL_PLANE_PATHS)
-    if target:
-        return GuardDecision(
-            "deny",
-            f"control-plane file is human-only: {target}. It decides what the "
-            "guard permits, so edit it directly rather than through an agent.",
-        )
+    Resolution follows symlinks, so the same call can reach a different file
+    once a link changes. Anything that remembers decisions has to key on these
+    as well as on the arguments.
+    """
+
+    resolve = (resolver or PathResolver()).resolve
+    normalized_tool = tool.lower().strip()
+    if normalized_tool in COMMAND_TOOLS:
+        _require("shell")
+        if not _may_write(command):
+            return []
+        return [resolve(target, cwd) for target in candidate_write_targets(command)]
+    if normalized_tool in PATCH_TOOLS:
+        paths, _ = parse_apply_patch(command or content)
+        return [resolve(target, cwd) for target in paths]
+    return [resolve(path, cwd)] if path else []
+
+
+def consults_git(tool: str, *, command: str = "") -> bool:
+    """Whether `evaluate` reads repository state to decide this tool call."""
+
+    if tool.lower().strip() not in COMMAND_TOOLS:
+        return False
+    _require("shell")
+    return bool(_GIT_COMMIT.search(command))
+
+
+def evaluate_command(
+    command: str,
+    *,
+    cwd: str | None = None,
+    resolver: PathResolver | None = None,
+    git_state: GitSnapshot | None = None,
+) -> GuardDecision:
+    if not command.strip():
+        return GuardDecision("allow")
+
+    _require("shell")
+    if _TRIGGERS.search(command):
+        decision = match_command_rule(command)
+        if decision:
+            return decision
+
+    if _may_write(command):
+        # Path rules have to apply here too, not just in evaluate_write: `echo x
+        # >> safety.py` reaches the same file as a write tool, and until this
+        # existed one line of shell switched off every path rule in this module.
+        resolve = (resolver or PathResolver()).resolve
+        targets = [
+            (target, resolve(target, cwd))
+            for target in candidate_write_targets(command)
+        ]
+        if targets:
+            _require("paths")
+        matches = [
+            (target, PATH_CLASSIFIER.classify(normalized))
+            for target, normalized in targets
+        ]
+        # Protected paths first, across every target, then the control plane.
+        for family in PATH_RULE_REASONS:
+            for target, match in matches:
+                if match and match.family == family:
+                    return _path_rule_decision(match, target)
 
-    warning = main_branch_commit_warning(command, cwd=cwd)
+    warning = main_branch_commit_warning(command, cwd=cwd, git_state=git_state)
     if warning:
-        return GuardDecision("warn", warning)
+        return GuardDecision("warn", warning, "main-branch-commit")
 
     return GuardDecision("allow")
 
 
-def evaluate_write(*, path: str = "", content: str = "") -> GuardDecision:
+def _may_write(command: str) -> bool:
+    """Whether the write-target lexer can find anything in `command`."""
+
+    return bool(_TRIGGERS.search(command) or _REWRITTEN_WORDS.search(command))
+
+
+def match_command_rule(command: str) -> GuardDecision | None:
+    """The deny decision of the first COMMAND_RULES entry matching, else None.
+
+    The combined pattern finds the leftmost match of any rule, which is not
+    necessarily the rule that takes precedence, so the rules ahead of it are
+    checked one by one. That only happens once something has matched, which
+    for real commands is rare.
+    """
+
+    _require("command")
+    match = _COMMAND_RULES_COMBINED.search(command)
+    if not match or not match.lastgroup:
+        return None
+    index = int(match.lastgroup.removeprefix("rule"))
+    for rule, reason, pattern in COMMAND_RULES[:index]:
+        if pattern.search(command):
+            return GuardDecision("deny", reason, rule)
+    rule, reason, _ = COMMAND_RULES[index]
+    return GuardDecision("deny", reason, rule)
+
+
+def evaluate_write(
+    *,
+    path: str = "",
+    content: str | bytes | bytearray | memoryview = "",
+    cwd: str | None = None,
+    resolver: PathResolver | None = None,
+) -> GuardDecision:
     if path:
-        display_path = normalize_path_for_matching(path)
-        if PROTECTED_PATHS.search(display_path):
-            return GuardDecision("deny", f"protected file blocked: {path}")
-        if CONTROL_PLANE_PATHS.search(display_path):
+        _require("paths")
+        display_path = (resolver or PathResolver()).resolve(path, cwd)
+        match = PATH_CLASSIFIER.classify(display_path)
+        if match:
+            return _path_rule_decision(match, path)
+
+    if content:
+        found = scan_for_secrets(content)
+        if found is None:
             return GuardDecision(
                 "deny",
-                f"control-plane file is human-only: {path}. It decides what the "
-                "guard permits, so edit it directly rather than through an agent.",
+                f"content exceeds the {SECRET_SCAN_BUDGET}-byte secret-scan budget",
+                "secret-scan-budget",
             )
-
-    if content and SECRET_CONTENT.search(content):
-        return GuardDecision("deny", "secret-like content detected")
+        if found:
+            return GuardDecision("deny", SECRET_CONTENT_REASON, "secret-content")
 
     return GuardDecision("allow")
 
 
-# Shell constructs that name a file the command writes to. Each captures the
-# span in which a target may appear; path-like tokens are pulled out of it and
-# matched against the ordinary path rules.
-_REDIRECT_TARGET = re.compile(r">>?\s*(?P<span>[^\s;|&<>]+)")
-_MUTATING_ARGV = re.compile(
-    r"\b(?:rm|mv|cp|tee|ln|install|truncate|shred|unlink|touch|chmod|chown)\b"
-    r"(?P<span>[^;|&]*)",
-    re.IGNORECASE,
+def evaluate_patch(
+    patch: str, *, cwd: str | None = None, resolver: PathResolver | None = None
+) -> GuardDecision:
+    """Evaluate every path an `apply_patch` touches, then the lines it adds.
+
+    The first path denied decides, as a write to that path would; otherwise the
+    added lines are checked for secrets together. Removed lines are not: taking
+    a secret out of a file is the fix, not the leak.
+    """
+
+    paths, added = parse_apply_patch(patch)
+    resolver = resolver or PathResolver()
+    for path in paths:
+        decision = evaluate_write(path=path, cwd=cwd, resolver=resolver)
+        if not decision.allowed:
+            return decision
+    return evaluate_write(content=added)
+
+
+_PATCH_PATH: re.Pattern[str]
+
+
+def _compile_patch_rules() -> None:
+    global _PATCH_PATH
+
+    _PATCH_PATH = re.compile(r"\*\*\* (?:(?:Add|Update|Delete) File|Move to): (.*)")
+
+
+def parse_apply_patch(patch: str) -> tuple[list[str], str]:
+    """The paths a `*** Begin Patch` envelope touches, and the lines it adds.
+
+    Paths come from Add, Update, and Delete headers and from `*** Move to:`,
+    each once, in order. Added lines are the `+` lines with the marker dropped,
+    newline-terminated.
+    """
+
+    _require("patch")
+    paths: dict[str, None] = {}
+    added: list[str] = []
+    for line in patch.split("\n"):
+        if line.startswith("+"):
+            if not line.startswith("+++"):
+                added.append(line[1:] + "\n")
+            continue
+        header = _PATCH_PATH.match(line)
+        if header and header.group(1):
+            paths.setdefault(header.group(1))
+    return list(paths), "".join(added)
+
+
+def scan_for_secrets(
+    content: str | bytes | bytearray | memoryview,
+    *,
+    budget: int | None = None,
+) -> bool | None:
+    """Whether `content` holds secret-like text; None when it exceeds `budget`.
+
+    Works through the content in overlapping windows by position, without
+    slicing or decoding it, and stops at the first hit. Bytes-like content is
+    matched as bytes, so a large payload is never copied into a str. `budget`
+    is in characters for str and bytes otherwise, and defaults to
+    SECRET_SCAN_BUDGET.
+    """
+
+    _require("secrets")
+    if isinstance(content, str):
+        pattern = SECRET_CONTENT
+        view: str | memoryview = content
+    else:
+        pattern = _SECRET_CONTENT_BYTES
+        view = memoryview(content).cast("B")
+    size = len(view)
+    if size > (SECRET_SCAN_BUDGET if budget is None else budget):
+        return None
+    for start in range(0, max(size, 1), _SECRET_WINDOW):
+        end = min(start + _SECRET_WINDOW + _SECRET_SPAN, size)
+        if pattern.search(view, start, end):
+            return True
+    return False
+
+
+# Write targets come from lexing the command the way the shell splits it, in one
+# pass: quoting and escapes, comments, pipelines and lists, subshells, command
+# and process substitution, and here-documents. Nested shell (`bash -c`, `eval`,
+# a here-document or pipeline fed to a shell, `find -exec`, `xargs`) is lexed in
+# turn. What the lexer cannot follow fails closed: the arguments of a command it
+# does not know are scanned the way the regexes before it did, and those of a
+# command named by a variable are all taken as targets.
+@dataclass(frozen=True)
+class WriteTarget:
+    path: str
+    # "redirect", "argv" (an operand of a mutating command), "sed-inplace",
+    # "dd", "heredoc" (where a here-document or here-string ends up), or
+    # "unparsed" (a path-like token in text the lexer does not follow: shell
+    # nested too deeply, or the arguments of a command it does not know).
+    kind: str
+
+
+# Commands whose operands are files they modify.
+_MUTATING_COMMANDS = frozenset(
+    {
+        "rm",
+        "mv",
+        "cp",
+        "tee",
+        "ln",
+        "install",
+        "truncate",
+        "shred",
+        "unlink",
+        "touch",
+        "chmod",
+        "chown",
+    }
+)
+# Interpreters whose `-c` argument, here-document, or here-string is shell.
+_SHELLS = frozenset({"sh", "bash", "zsh", "dash", "ksh", "fish"})
+# Commands whose arguments are only ever data, never a command they run or a
+# file they write; anything not named here or handled below is scanned.
+_INERT_COMMANDS = frozenset({"echo", "printf", "test", "[", "[[", ":"})
+_RESERVED_WORDS = frozenset(
+    {"!", "{", "}", "if", "then", "elif", "else", "while", "until", "do"}
 )
-_SED_INPLACE = re.compile(r"\bsed\b(?P<span>[^;|&]*?-i(?:\S*)?[^;|&]*)", re.IGNORECASE)
-_DD_TARGET = re.compile(r"\bdd\b[^;|&]*?\bof=(?P<span>[^\s;|&]+)", re.IGNORECASE)
+# Commands that run the rest of their arguments as a command: the options that
+# take a value, and how many operands come before the command (a duration).
+_WRAPPERS: dict[str, tuple[frozenset[str], int]] = {
+    "builtin": (frozenset(), 0),
+    "caffeinate": (frozenset({"-t", "-w"}), 0),
+    "command": (frozenset(), 0),
+    "doas": (frozenset({"-u", "-C"}), 0),
+    "env": (frozenset({"-u", "-C", "-S", "--unset", "--chdir"}), 0),
+    "exec": (frozenset({"-a"}), 0),
+    "gtimeout": (frozenset({"-s", "-k", "--signal", "--kill-after"}), 1),
+    "nice": (frozenset({"-n"}), 0),
+    "nohup": (frozenset(), 0),
+    "stdbuf": (frozenset({"-i", "-o", "-e"}), 0),
+    "sudo": (frozenset({"-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U"}), 0),
+    "time": (frozenset(), 0),
+    "timeout": (frozenset({"-s", "-k", "--signal", "--kill-after"}), 1),
+    "unbuffer": (frozenset(), 0),
+    "watch": (frozenset({"-n", "-d", "--interval"}), 0),
+    "xargs": (frozenset({"-I", "-L", "-n", "-P", "-d", "-E", "-s", "-a"}), 0),
+}
+_SED_SCRIPT_OPTIONS = frozenset({"-e", "-f", "--expression", "--file"})
+# Beyond this depth of nested shell the lexer stops following it and falls back
+# to treating every path-like token as a target.
+_MAX_NESTING = 8
+
+_PLAIN: re.Pattern[str]
+_DOUBLE_QUOTED_PLAIN: re.Pattern[str]
+_REDIRECT: re.Pattern[str]
+_ASSIGNMENT: re.Pattern[str]
+_PATH_TOKEN: re.Pattern[str]
+_UNPARSED_WRITES: tuple[re.Pattern[str], ...]
+
+
+def _compile_write_target_rules() -> None:
+    global _PLAIN, _DOUBLE_QUOTED_PLAIN, _REDIRECT, _ASSIGNMENT, _PATH_TOKEN
+    global _UNPARSED_WRITES
+
+    # Runs of characters with no meaning to the lexer, consumed in one step.
+    _PLAIN = re.compile(r"[^\s'\"\\$`;&|()<>]+")
+    _DOUBLE_QUOTED_PLAIN = re.compile(r"[^\"\\$`]+")
+    _REDIRECT = re.compile(
+        r"(?:\d+|\{[A-Za-z_]\w*\})?"
+        r"(?P<op>&>>|&>|>>|>\||>&|>|<<<|<<-|<<|<>|<&|<)"
+    )
+    _ASSIGNMENT = re.compile(r"[A-Za-z_]\w*\+?=")
+    _PATH_TOKEN = re.compile(r"[^\s;|&<>'\"]*[/~][^\s;|&<>'\"]*")
+    # Text the lexer cannot follow, such as `python3 -c` code or the command a
+    # wrapper it does not know runs, is scanned for these constructs instead.
+    # Each captures the span in which a target may appear.
+    _UNPARSED_WRITES = (
+        re.compile(r">>?\s*(?P<span>[^\s;|&<>]+)"),
+        re.compile(
+            r"\b(?:rm|mv|cp|tee|ln|install|truncate|shred|unlink|touch|chmod|chown)\b"
+            r"(?P<span>[^;|&]*)",
+            re.IGNORECASE,
+        ),
+        re.compile(r"\bsed\b(?P<span>[^;|&]*?-i(?:\S*)?[^;|&]*)", re.IGNORECASE),
+        re.compile(r"\bdd\b[^;|&]*?\bof=(?P<span>[^\s;|&]+)", re.IGNORECASE),
+    )
+
+
+def write_targets(command: str) -> list[WriteTarget]:
+    """Every file `command` appears to write to, typed by the construct naming it.
 
-_PATH_TOKEN = re.compile(r"[^\s;|&<>'\"]*[/~][^\s;|&<>'\"]*")
+    A lexer, not a shell: variables are not expanded, so `$DIR/x` is matched as
+    written. Where it cannot tell what runs, it errs toward a target: the
+    arguments of a command it does not know, `python3 -c` code among them, are
+    scanned for a mutating command or redirection, and every path-like argument
+    of a command named by a variable is one. A file written through an alias or
+    by code that never names a write still gets past it. The job here is to stop
+    the guard being switched off by an ordinary edit, not to sandbox the shell.
+    The merge gate is what actually holds.
+    """
+
+    _require("write-targets")
+    return _ShellLexer(command).run()
 
 
 def candidate_write_targets(command: str) -> list[str]:
-    """Path-like tokens that a shell command appears to write to.
+    """The paths of write_targets(command), in order."""
+
+    return [target.path for target in write_targets(command)]
+
+
+class _ShellLexer:
+    """One pass over a command line, collecting WriteTargets as it goes."""
+
+    def __init__(self, text: str, depth: int = 0) -> None:
+        self.text = text
+        self.pos = 0
+        self.depth = depth
+        self.targets: list[WriteTarget] = []
+        # Whether the innermost open substitution is a backquoted one, which a
+        # bare backquote closes.
+        self.in_backquotes = False
+        # Here-documents whose bodies start after the current line:
+        # (delimiter, strip leading tabs, delimiter quoted, the command's words).
+        self.heredocs: list[tuple[str, bool, bool, list[str]]] = []
+        # The words of commands whose output a shell reads as its script.
+        self.shell_input: list[list[str]] = []
+
+    def run(self) -> list[WriteTarget]:
+        self.parse_list(None)
+        return self.targets
+
+    def parse_list(self, close: str | None) -> None:
+        """Commands and their separators, up to `close` or the end."""
+
+        text = self.text
+        # The commands earlier in the current pipeline.
+        upstream: list[list[str]] = []
+        while self.pos < len(text):
+            words = self.parse_command(close, upstream)
+            if self.pos >= len(text) or text[self.pos] == close:
+                return
+            if text[self.pos] == "|" and not text.startswith("||", self.pos):
+                upstream.append(words)
+                self.pos += 2 if text.startswith("|&", self.pos) else 1
+                continue
+            upstream = []
+            if text[self.pos] == "\n":
+                self.pos += 1
+                self.read_heredocs()
+            else:
+                # `;`, `&`, `|`, or a `)` that closes nothing open here, such
+                # as a `case` pattern's; the list goes on either way.
+                self.pos += 1
 
-    Regex, not a shell parser. It recognizes redirection, the common mutating
-    commands, `sed -i`, and `dd of=`. A here-doc, a `python3 -c` one-liner, or
-    an alias will get past it, and that is understood: the job here is to stop
-    the guard being switched off by an ordinary one-line edit, not to sandbox
-    the shell. The merge gate is what actually holds.
+    def parse_command(self, close: str | None, upstream: list[list[str]]) -> list[str]:
+        text = self.text
+        words: list[str] = []
+        redirects: list[str] = []
+        fed = False
+        in_test = False
+        while True:
+            self.skip_blanks()
+            if self.pos >= len(text):
+                break
+            char = text[self.pos]
+            if char in "\n;|)" or (char == "`" and close == "`"):
+                break
+            if char == "#":
+                newline = text.find("\n", self.pos)
+                self.pos = len(text) if newline < 0 else newline
+                continue
+            if char == "(":
+                if not words and text.startswith("((", self.pos):
+                    self.skip_balanced(self.pos + 2, 2)
+                else:
+                    self.substitute(")", self.pos + 1)
+                continue
+            redirect = None
+            if not in_test and text[self.pos + 1 : self.pos + 2] != "(":
+                redirect = _REDIRECT.match(text, self.pos)
+            if redirect:
+                fed = self.read_redirect(redirect, words, redirects) or fed
+                continue
+            if char == "&":
+                break
+            start = self.pos
+            word = self.read_word()
+            if self.pos == start:
+                # A `<` or `>` inside `[[ ]]`, where it compares.
+                word = char
+                self.pos += 1
+            if word in {"{", "}"}:
+                # A brace group: what came before it is a command of its own.
+                self.command_targets(words, fed)
+                words = []
+                continue
+            in_test = (in_test or (word == "[[" and not words)) and word != "]]"
+            words.append(word)
+        kind = "heredoc" if fed else "redirect"
+        for path in redirects:
+            self.add(path, kind)
+        self.command_targets(words, fed, upstream)
+        return words
+
+    def read_redirect(
+        self, redirect: re.Match[str], words: list[str], redirects: list[str]
+    ) -> bool:
+        """Consume one redirection; True when it feeds the command text."""
+
+        op = redirect.group("op")
+        self.pos = redirect.end()
+        self.skip_blanks()
+        start = self.pos
+        word = self.read_word()
+        if op in {"<<", "<<-"}:
+            quoted = any(char in "'\"\\" for char in self.text[start : self.pos])
+            self.heredocs.append((word, op == "<<-", quoted, words))
+            return True
+        if op == "<<<":
+            if _command_and_args(words)[0] in _SHELLS:
+                self.nested(word)
+            return True
+        if op in {"<", "<&"} or (op == ">&" and (word.isdigit() or word == "-")):
+            return False
+        redirects.append(word)
+        return False
+
+    def read_heredocs(self) -> None:
+        """Consume the bodies of the here-documents opened on the last line."""
+
+        text = self.text
+        pending, self.heredocs = self.heredocs, []
+        for delimiter, strip_tabs, quoted, words in pending:
+            start = end = self.pos
+            while self.pos < len(text):
+                newline = text.find("\n", self.pos)
+                line_end = len(text) if newline < 0 else newline
+                line = text[self.pos : line_end]
+                end = self.pos
+                self.pos = min(line_end + 1, len(text))
+                if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+                    break
+                end = self.pos
+            body = text[start:end]
+            name, args = _command_and_args(words)
+            if name in _SHELLS and _shell_script(args) is None:
+                self.nested(body)
+            elif any(words is fed for fed in self.shell_input):
+                # A here-document a pipeline passes on to a shell.
+                self.nested(body)
+            elif not quoted:
+                # An unquoted here-document still runs `$(...)` and backquotes.
+                lexer = _ShellLexer(body, self.depth + 1)
+                lexer.read_double_quoted(None)
+                self.targets.extend(lexer.targets)
+
+    def read_word(self) -> str:
+        """The next word with quotes removed; expansions are kept as written."""
+
+        text = self.text
+        parts: list[str] = []
+        while self.pos < len(text):
+            plain = _PLAIN.match(text, self.pos)
+            if plain:
+                parts.append(plain.group())
+                self.pos = plain.end()
+                continue
+            char = text[self.pos]
+            follower = text[self.pos + 1 : self.pos + 2]
+            if char == "\\":
+                if follower != "\n":
+                    parts.append(follower)
+                self.pos += 2
+            elif char == "'":
+                end = text.find("'", self.pos + 1)
+                end = len(text) if end < 0 else end
+                parts.append(text[self.pos + 1 : end])
+                self.pos = end + 1
+            elif char == '"':
+                self.pos += 1
+                parts.append(self.read_double_quoted('"'))
+            elif char == "$" and follower == "'":
+                parts.append(self.read_ansi_c_quoted())
+            elif char == "$" and follower == '"':
+                self.pos += 1
+            elif char == "$":
+                start = self.pos
+                self.read_expansion()
+                parts.append(text[start : self.pos])
+            elif char == "`" and not self.in_backquotes:
+                start = self.pos
+                self.substitute("`", self.pos + 1)
+                parts.append(text[start : self.pos])
+            elif char in "<>" and follower == "(":
+                start = self.pos
+                self.substitute(")", self.pos + 2)
+                parts.append(text[start : self.pos])
+            else:
+                break
+        return "".join(parts)
+
+    def read_double_quoted(self, close: str | None) -> str:
+        """The inside of a "..." string, or of a here-document if `close` is None."""
+
+        text = self.text
+        parts: list[str] = []
+        while self.pos < len(text):
+            plain = _DOUBLE_QUOTED_PLAIN.match(text, self.pos)
+            if plain:
+                parts.append(plain.group())
+                self.pos = plain.end()
+                continue
+            char = text[self.pos]
+            if char == close:
+                self.pos += 1
+                break
+            if char == "\\":
+                follower = text[self.pos + 1 : self.pos + 2]
+                if follower in {"$", "`", '"', "\\"}:
+                    parts.append(follower)
+                    self.pos += 2
+                    continue
+                if follower == "\n":
+                    self.pos += 2
+                    continue
+                parts.append(char)
+                self.pos += 1
+            elif char == "$":
+                start = self.pos
+                self.read_expansion()
+                parts.append(text[start : self.pos])
+            elif char == "`":
+                start = self.pos
+                self.substitute("`", self.pos + 1)
+                parts.append(text[start : self.pos])
+            else:
+                parts.append(char)
+                self.pos += 1
+        return "".join(parts)
+
+    def read_ansi_c_quoted(self) -> str:
+        text = self.text
+        index = self.pos + 2
+        parts: list[str] = []
+        while index < len(text) and text[index] != "'":
+            if text[index] == "\\" and index + 1 < len(text):
+                parts.append(text[index : index + 2])
+                index += 2
+            else:
+                parts.append(text[index])
+                index += 1
+        self.pos = index + 1
+        return "".join(parts)
+
+    def read_expansion(self) -> None:
+        """Step over a `$` expansion, lexing any command substitution in it."""
+
+        text = self.text
+        if text.startswith("$((", self.pos):
+            self.skip_balanced(self.pos + 3, 2)
+        elif text.startswith("$(", self.pos):
+            self.substitute(")", self.pos + 2)
+        elif text.startswith("${", self.pos):
+            end = text.find("}", self.pos + 2)
+            self.pos = len(text) if end < 0 else end + 1
+        else:
+            self.pos += 1
+            while self.pos < len(text) and (
+                text[self.pos].isalnum() or text[self.pos] == "_"
+            ):
+                self.pos += 1
+
+    def substitute(self, close: str, start: int) -> None:
+        """Lex the commands from `start` up to and including `close`."""
+
+        self.pos = start
+        if self.depth >= _MAX_NESTING:
+            self.give_up()
+            return
+        self.depth += 1
+        outer, self.in_backquotes = self.in_backquotes, close == "`"
+        self.parse_list(close)
+        self.in_backquotes = outer
+        self.depth -= 1
+        if self.pos < len(self.text) and self.text[self.pos] == close:
+            self.pos += 1
+
+    def skip_balanced(self, start: int, depth: int) -> None:
+        """Step past `depth` unclosed parentheses that open before `start`."""
+
+        text = self.text
+        self.pos = start
+        while self.pos < len(text) and depth:
+            depth += {"(": 1, ")": -1}.get(text[self.pos], 0)
+            self.pos += 1
+
+    def skip_blanks(self) -> None:
+        text = self.text
+        while self.pos < len(text):
+            if text[self.pos] in " \t":
+                self.pos += 1
+            elif text.startswith("\\\n", self.pos):
+                self.pos += 2
+            else:
+                return
+
+    def nested(self, script: str) -> None:
+        """Lex `script`, a string this command runs as shell."""
+
+        if self.depth >= _MAX_NESTING:
+            self.unparsed(script)
+        else:
+            self.targets.extend(_ShellLexer(script, self.depth + 1).run())
+
+    def give_up(self) -> None:
+        """Treat the rest of the text as unparsed and stop lexing it."""
+
+        self.unparsed(self.text[self.pos :])
+        self.pos = len(self.text)
+
+    def unparsed(self, text: str) -> None:
+        """Past _MAX_NESTING, every path-like token is a target."""
+
+        for token in _PATH_TOKEN.findall(text):
+            self.add(token.strip("'\""), "unparsed")
+
+    def add(self, path: str, kind: str) -> None:
+        for home in ("$HOME", "${HOME}"):
+            if path.startswith(home) and path[len(home) : len(home) + 1] in {"", "/"}:
+                path = "~" + path[len(home) :]
+        if path:
+            self.targets.append(WriteTarget(path, kind))
+
+    def unparsed_writes(self, args: list[str]) -> None:
+        """Scan the arguments of a command the lexer cannot follow."""
+
+        text = " ".join(args)
+        for pattern in _UNPARSED_WRITES:
+            for match in pattern.finditer(text):
+                self.unparsed(match.group("span"))
+
+    def command_targets(
+        self, words: list[str], fed: bool, upstream: list[list[str]]
+    ) -> None:
+        """The targets named by the arguments of one simple command.
+
+        `upstream` holds the commands piped into this one.
+        """
+
+        name, args = _command_and_args(words)
+        if name in _SHELLS:
+            script = _shell_script(args)
+            if script is not None:
+                self.nested(script)
+            elif upstream:
+                # A shell reading a pipe runs what the commands before it
+                # print, which is most often their arguments.
+                self.shell_input.extend(upstream)
+                self.nested(
+                    "\n".join(
+                        " ".join(_command_and_args(command)[1]) for command in upstream
+                    )
+                )
+        elif name == "eval":
+            self.nested(" ".join(args))
+        elif name == "find":
+            command: list[str] | None = None
+            for arg in args:
+                if arg in {"-exec", "-execdir", "-ok", "-okdir"}:
+                    command = []
+                elif command is not None and arg in {";", "+"}:
+                    self.command_targets(command, False, [])
+                    command = None
+                elif command is not None:
+                    command.append(arg)
+        elif name == "sed":
+            self.sed_targets(args)
+        elif name == "dd":
+            for arg in args:
+                if arg.startswith("of="):
+                    self.add(arg[3:], "dd")
+        elif name in _MUTATING_COMMANDS:
+            kind = "heredoc" if fed and name == "tee" else "argv"
+            for operand in _operands(args):
+                self.add(operand, kind)
+        elif "$" in name or "`" in name:
+            # `$CP x y`: no telling what runs, so every path is a target.
+            self.unparsed(" ".join(args))
+        elif name == "git":
+            self.unparsed_writes(_without_messages(args))
+        elif name and name not in _INERT_COMMANDS:
+            self.unparsed_writes(args)
+
+    def sed_targets(self, args: list[str]) -> None:
+        in_place = False
+        scripted = False
+        operands: list[str] = []
+        options = True
+        skip = False
+        for arg in args:
+            if skip:
+                skip = False
+            elif options and arg == "--":
+                options = False
+            elif options and arg.startswith("--"):
+                in_place = in_place or arg.split("=", 1)[0] == "--in-place"
+                scripted = scripted or arg.split("=", 1)[0] in _SED_SCRIPT_OPTIONS
+                skip = arg in _SED_SCRIPT_OPTIONS
+            elif options and arg.startswith("-") and arg != "-":
+                in_place = in_place or "i" in arg[1:]
+                scripted = scripted or arg[:2] in _SED_SCRIPT_OPTIONS
+                skip = arg in _SED_SCRIPT_OPTIONS
+            else:
+                operands.append(arg)
+        if not in_place:
+            return
+        # Without -e or -f, the first operand is the script itself.
+        for operand in operands if scripted else operands[1:]:
+            self.add(operand, "sed-inplace")
+
+
+def _command_and_args(words: list[str]) -> tuple[str, list[str]]:
+    """The command a simple command runs, lowercased, and its arguments.
+
+    Skips assignments, reserved words, and wrappers such as `env` or `xargs`.
+    Lowercased because a case-insensitive filesystem finds `RM` as `rm`.
     """
 
-    targets: list[str] = []
-    for pattern in (_REDIRECT_TARGET, _MUTATING_ARGV, _SED_INPLACE, _DD_TARGET):
-        for match in pattern.finditer(command):
-            targets.extend(_PATH_TOKEN.findall(match.group("span")))
-    return [token.strip("'\"") for token in targets if token.strip("'\"")]
+    index = 0
+    while index < len(words):
+        word = words[index]
+        if word in _RESERVED_WORDS or _ASSIGNMENT.match(word):
+            index += 1
+            continue
+        name = word.rsplit("/", 1)[-1].lower()
+        wrapper = _WRAPPERS.get(name)
+        if wrapper is None:
+            return name, words[index + 1 :]
+        valued, positional = wrapper
+        index += 1
+        while index < len(words) and words[index].startswith("-"):
+            index += 2 if words[index] in valued else 1
+            if words[index - 1] == "--":
+                break
+        index += positional
+    return "", []
+
+
+def _shell_script(args: list[str]) -> str | None:
+    """The `-c` script a shell is given, or None when it reads a file or stdin."""
+
+    command_string = False
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg.startswith(("-", "+")) and len(arg) > 1 and arg != "--":
+            if not arg.startswith("--"):
+                command_string = command_string or "c" in arg[1:]
+                skip = arg[1:] in {"o", "O"}
+        elif command_string:
+            return arg
+        else:
+            return None
+    return None
+
 
+def _without_messages(args: list[str]) -> list[str]:
+    """`git` arguments less any `-m` message, which is data however it reads."""
 
-def writes_to(command: str, pattern: re.Pattern[str]) -> str:
+    kept: list[str] = []
+    message = False
+    for arg in args:
+        if message:
+            message = False
+        elif arg == "--message" or (
+            arg.startswith("-") and not arg.startswith("--") and arg.endswith("m")
+        ):
+            message = True
+        elif not arg.startswith("--message="):
+            kept.append(arg)
+    return kept
+
+
+def _operands(args: list[str]) -> list[str]:
+    """The arguments that are not options, honoring `--`."""
+
+    operands: list[str] = []
+    options = True
+    for arg in args:
+        if options and arg == "--":
+            options = False
+        elif options and arg.startswith("-") and arg != "-":
+            continue
+        else:
+            operands.append(arg)
+    return operands
+
+
+def writes_to(
+    command: str,
+    pattern: re.Pattern[str],
+    *,
+    cwd: str | None = None,
+    resolver: PathResolver | None = None,
+) -> str:
     """The first write target in `command` matching `pattern`, else ""."""
 
+    resolve = (resolver or PathResolver()).resolve
     for target in candidate_write_targets(command):
-        if pattern.search(normalize_path_for_matching(target)):
+        if pattern.search(resolve(target, cwd)):
             return target
     return ""
 
 
-def normalize_path_for_matching(path: str) -> str:
+def normalize_path_for_matching(path: str, cwd: str | None = None) -> str:
+    """`path` with `~` expanded and symlinks resolved, relative to `cwd`.
+
+    `cwd` defaults to the process's own working directory.
+    """
+
     expanded = os.path.expanduser(path)
+    if cwd and not os.path.isabs(expanded):
+        expanded = os.path.join(os.path.expanduser(cwd), expanded)
     try:
         return str(Path(expanded).resolve())
     except OSError:
         return expanded
 
 
-def main_branch_commit_warning(command: str, *, cwd: str | None = None) -> str:
-    if not re.search(r"^\s*(git\s+commit|git\s+-C\s+\S+\s+commit)\b", command):
+class PathResolver:
+    """Memoizes normalize_path_for_matching for each (cwd, path) it is asked.
+
+    Resolving walks the path with lstat/readlink, and one command can name the
+    same target for the protected and the control-plane rules, or many times
+    over. A resolver lives for one evaluation unless `ttl` is set; a long-lived
+    guard can then keep one across calls, accepting that a symlink repointed
+    within `ttl` seconds is matched by where it used to lead.
+    """
+
+    # Past this many entries the memo starts over rather than growing.
+    MAX_ENTRIES = 4096
+
+    def __init__(self, *, ttl: float | None = None) -> None:
+        self.ttl = ttl
+        self._resolved: dict[tuple[str, str], str] = {}
+        self._expires = 0.0
+
+    def resolve(self, path: str, cwd: str | None = None) -> str:
+        if self.ttl is not None:
+            import time
+
+            now = time.monotonic()
+            if now >= self._expires:
+                self._resolved.clear()
+                self._expires = now + self.ttl
+        key = (cwd or "", path)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            if len(self._resolved) >= self.MAX_ENTRIES:
+                self._resolved.clear()
+            resolved = self._resolved[key] = normalize_path_for_matching(path, cwd)
+        return resolved
+
+
+def main_branch_commit_warning(
+    command: str, *, cwd: str | None = None, git_state: GitSnapshot | None = None
+) -> str:
+    _require("shell")
+    if not _GIT_COMMIT.search(command):
         return ""
 
     workdir = cwd or os.getcwd()
-    branch = run_git(["branch", "--show-current"], cwd=workdir)
+    if git_state is not None:
+        return git_state.branch_warning(workdir)
+    return _branch_warning(workdir)
+
+
+class GitSnapshot:
+    """Repository state read once per working directory, for a batch of calls.
+
+    Without one, every `git commit` the guard sees finds its repository, reads
+    HEAD, and stats the refs. A snapshot keeps the first answer for each cwd,
+    so it should not outlive the batch it serves.
+    """
+
+    def __init__(self) -> None:
+        self._warnings: dict[str, str] = {}
+
+    def branch_warning(self, workdir: str) -> str:
+        warning = self._warnings.get(workdir)
+        if warning is None:
+            warning = self._warnings[workdir] = _branch_warning(workdir)
+        return warning
+
+
+def _branch_warning(workdir: str) -> str:
+    """The main-branch commit warning for a commit made in `workdir`, or ""."""
+
+    repo = find_repository(workdir)
+    if repo is None:
+        return ""
+    repo_root, git_dir, common_dir = repo
+    branch = current_branch(git_dir)
     if branch not in {"main", "master"}:
         return ""
 
-    repo_root = run_git(["rev-parse", "--show-toplevel"], cwd=workdir)
-    commit_count = run_git(["rev-list", "--count", "HEAD"], cwd=workdir)
     home = str(Path.home())
-    try:
-        commits = int(commit_count)
-    except ValueError:
-        commits = 0
-
-    if repo_root != home and commits >= 100:
+    if repo_root == home:
+        return ""
+    if commit_count_at_least(git_dir, common_dir, 100, cwd=workdir):
         return (
             f"WARNING: You are on the protected '{branch}' branch. "
             "Create a feature branch before committing."
@@ -264,7 +1587,158 @@ def main_branch_commit_warning(command: str, *, cwd: str | None = None) -> str:
     return ""
 
 
+# Repository state is read straight out of the git directory: the guard runs on
+# every command, and three `git` spawns, one of them a full history walk, were
+# most of what a `git commit` check cost.
+
+
+def find_repository(workdir: str) -> tuple[str, Path, Path] | None:
+    """(worktree root, git dir, common dir) for `workdir`, or None outside git.
+
+    Follows the `gitdir:` file of a linked worktree or submodule and the
+    `commondir` file that points a worktree's refs back at the main repository.
+    """
+
+    # Git honors these over discovery; leave that to git itself.
+    if "GIT_DIR" in os.environ or "GIT_WORK_TREE" in os.environ:
+        root = run_git(["rev-parse", "--show-toplevel"], cwd=workdir)
+        git_dir = run_git(["rev-parse", "--absolute-git-dir"], cwd=workdir)
+        common_dir = run_git(["rev-parse", "--git-common-dir"], cwd=workdir)
+        if not (root and git_dir and common_dir):
+            return None
+        return root, Path(git_dir), Path(workdir, common_dir)
+
+    try:
+        start = Path(workdir).resolve()
+    except OSError:
+        return None
+    if not start.is_dir():
+        return None
+    for directory in (start, *start.parents):
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            git_dir = dot_git
+        elif dot_git.is_file():
+            try:
+                pointer = dot_git.read_text().strip()
+            except OSError:
+                return None
+            if not pointer.startswith("gitdir:"):
+                return None
+            git_dir = (directory / pointer.removeprefix("gitdir:").strip()).resolve()
+        else:
+            continue
+        try:
+            common = (git_dir / "commondir").read_text().strip()
+        except OSError:
+            common_dir = git_dir
+        else:
+            common_dir = (git_dir / common).resolve()
+        return str(directory), git_dir, common_dir
+    return None
+
+
+def current_branch(git_dir: Path) -> str:
+    """The checked-out branch name, or "" when HEAD is detached or unreadable."""
+
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+    except OSError:
+        return ""
+    return head.removeprefix("ref: refs/heads/") if head.startswith("ref: ") else ""
+
+
+# Per common dir: the stamp of HEAD, the refs and the commit-graph when the count
+# was taken, and the count. A long-lived guard recounts only when one changes.
+_COMMIT_COUNTS: dict[Path, tuple[tuple[int, ...], int]] = {}
+
+
+def commit_count_at_least(
+    git_dir: Path, common_dir: Path, limit: int, *, cwd: str
+) -> bool:
+    """Whether the repository holds at least `limit` commits.
+
+    Reads the count from the commit-graph when there is one. That counts every
+    commit the graph covers, on any branch, as of the last `git gc` or fetch
+    that wrote it, which is close enough for a threshold. Without a graph, or
+    when it is still under `limit`, git walks at most `limit` commits from HEAD.
+    """
+
+    stamp = _git_state_stamp(git_dir, common_dir)
+    cached = _COMMIT_COUNTS.get(common_dir)
+    if cached is not None and cached[0] == stamp:
+        return cached[1] >= limit
+
+    count = commit_graph_count(common_dir)
+    if count < limit:
+        walked = run_git(
+            ["rev-list", "--count", f"--max-count={limit}", "HEAD"], cwd=cwd
+        )
+        count = int(walked) if walked.isdigit() else 0
+    _COMMIT_COUNTS[common_dir] = (stamp, count)
+    return count >= limit
+
+
+def _git_state_stamp(git_dir: Path, common_dir: Path) -> tuple[int, ...]:
+    paths = [
+        git_dir / "HEAD",
+        common_dir / "packed-refs",
+        common_dir / "objects" / "info" / "commit-graph",
+        common_dir / "objects" / "info" / "commit-graphs" / "commit-graph-chain",
+    ]
+    branch = current_branch(git_dir)
+    if branch:
+        paths.append(common_dir / "refs" / "heads" / branch)
+    stamp: list[int] = []
+    for path in paths:
+        try:
+            stamp.append(path.stat().st_mtime_ns)
+        except OSError:
+            stamp.append(0)
+    return tuple(stamp)
+
+
+def commit_graph_count(common_dir: Path) -> int:
+    """Commits recorded in the repository's commit-graph, or 0 without one."""
+
+    # Like git, prefer a single graph file and fall back to a split chain.
+    info = common_dir / "objects" / "info"
+    if (info / "commit-graph").is_file():
+        return _graph_file_count(info / "commit-graph")
+    try:
+        chain = (info / "commit-graphs" / "commit-graph-chain").read_text().split()
+    except OSError:
+        return 0
+    return sum(
+        _graph_file_count(info / "commit-graphs" / f"graph-{digest}.graph")
+        for digest in chain
+    )
+
+
+def _graph_file_count(path: Path) -> int:
+    # Format: "CGPH", version, hash version, chunk count, base graph count, then
+    # a table of (4-byte chunk id, 8-byte offset) entries. The OID fanout chunk
+    # is 256 cumulative big-endian counts, so its last entry is the total.
+    try:
+        with path.open("rb") as graph:
+            header = graph.read(8)
+            if len(header) != 8 or header[:4] != b"CGPH":
+                return 0
+            table = graph.read(12 * (header[6] + 1))
+            for entry in range(0, len(table) - 11, 12):
+                if table[entry : entry + 4] == b"OIDF":
+                    offset = int.from_bytes(table[entry + 4 : entry + 12], "big")
+                    graph.seek(offset + 255 * 4)
+                    return int.from_bytes(graph.read(4), "big")
+    except OSError:
+        pass
+    return 0
+
+
 def run_git(args: list[str], *, cwd: str) -> str:
+    # Only reached off the fast path, so the import waits until then.
+    import subprocess
+
     try:
         result = subprocess.run(
             ["git", *args],
@@ -280,3 +1754,37 @@ def run_git(args: list[str], *, cwd: str) -> str:
     if result.returncode != 0:
         return ""
     return result.stdout.strip()
+
+
+# Registered last, once every builder above exists.
+_RULE_GROUPS = {
+    "shell": _compile_shell_gates,
+    "command": _compile_command_rules,
+    "paths": _compile_path_rules,
+    "path-patterns": _compile_path_patterns,
+    "secrets": _compile_secret_rules,
+    "patch": _compile_patch_rules,
+    "write-targets": _compile_write_target_rules,
+}
+_RULE_GROUP_NAMES = {
+    "shell": ("_TRIGGERS", "_REWRITTEN_WORDS", "_GIT_COMMIT"),
+    "command": (
+        "PRIVILEGE_ESCALATION",
+        "DANGEROUS_COMMANDS",
+        "OBFUSCATED_EXECUTION",
+        "COMMAND_RULES",
+        "_COMMAND_RULES_COMBINED",
+    ),
+    "paths": ("PATH_CLASSIFIER",),
+    "path-patterns": ("PROTECTED_PATHS", "CONTROL_PLANE_PATHS"),
+    "secrets": ("SECRET_CONTENT", "_SECRET_CONTENT_BYTES"),
+    "patch": ("_PATCH_PATH",),
+    "write-targets": (
+        "_PLAIN",
+        "_DOUBLE_QUOTED_PLAIN",
+        "_REDIRECT",
+        "_ASSIGNMENT",
+        "_PATH_TOKEN",
+        "_UNPARSED_WRITES",
+    ),
+}
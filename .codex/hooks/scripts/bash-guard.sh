@@ -7,34 +7,40 @@ set -euo pipefail
 
 trap 'echo "{\"hookSpecificOutput\":{\"hookEventName\":\"PreToolUse\",\"permissionDecision\":\"deny\",\"permissionDecisionReason\":\"Hook error - fail-closed\"}}"; exit 0' ERR
 
-input=$(cat)
-command=$(echo "$input" | jq -r '.tool_input.command // empty' 2>/dev/null || echo "")
-
-[ -z "$command" ] && exit 0
-
 harness="claude"
 case "$0" in
     *".codex/"*) harness="codex" ;;
 esac
 
+# The guard bundle `generate` builds under run/ starts faster than the generator
+# script: `-I -S` skips site and .pth processing, and it holds nothing but the
+# guard. The script is the fallback until there is a bundle this user owns.
+guard_bundle="$HOME/.agents/harness/run/harness-guard.pyz"
+if [ -f "$guard_bundle" ] && [ -O "$guard_bundle" ]; then
+    guard=(python3 -I -S "$guard_bundle")
+else
+    guard=(python3 "$HOME/scripts/agent-harnesses.py" guard)
+fi
+
+deny() {
+    jq -n --arg reason "$1" '{
+      hookSpecificOutput: {
+        hookEventName: "PreToolUse",
+        permissionDecision: "deny",
+        permissionDecisionReason: $reason
+      }
+    }'
+}
+
+# `--hook` reads the PreToolUse envelope on stdin as the harness sent it and
+# prints the hook reply itself. It exits 0 whatever it decides, so any other
+# status means it crashed or never started. Claude and Codex take a failing hook
+# as a non-blocking error and run the call, so that is answered with a deny.
 status=0
-result=$(python3 "$HOME/scripts/agent-harnesses.py" guard --harness "$harness" --tool bash --command "$command" 2>/dev/null) || status=$?
-decision=$(printf '%s' "$result" | jq -r '.decision // "deny"')
-reason=$(printf '%s' "$result" | jq -r '.reason // "Shared guard failed closed"')
-
-case "$decision" in
-    deny)
-        jq -n --arg reason "$reason" '{
-          hookSpecificOutput: {
-            hookEventName: "PreToolUse",
-            permissionDecision: "deny",
-            permissionDecisionReason: $reason
-          }
-        }'
-        ;;
-    warn)
-        jq -n --arg reason "$reason" '{systemMessage: $reason}'
-        ;;
-esac
-
+reply=$("${guard[@]}" --hook "$harness") || status=$?
+if [ "$status" -ne 0 ]; then
+    deny "Shared guard failed closed (exit $status)"
+    exit 0
+fi
+[ -z "$reply" ] || printf '%s\n' "$reply"
 exit 0
@@ -7,60 +7,40 @@ set -euo pipefail
 
 trap 'echo "{\"hookSpecificOutput\":{\"hookEventName\":\"PreToolUse\",\"permissionDecision\":\"deny\",\"permissionDecisionReason\":\"Hook error - fail-closed\"}}"; exit 0' ERR
 
-script_dir=$(cd "$(dirname "$0")" && pwd)
-# shellcheck source=apply-patch-input.sh
-# shellcheck disable=SC1091
-source "$script_dir/apply-patch-input.sh"
-
-input=$(cat)
-
 harness="claude"
 case "$0" in
     *".codex/"*) harness="codex" ;;
 esac
 
+# The guard bundle `generate` builds under run/ starts faster than the generator
+# script: `-I -S` skips site and .pth processing, and it holds nothing but the
+# guard. The script is the fallback until there is a bundle this user owns.
+guard_bundle="$HOME/.agents/harness/run/harness-guard.pyz"
+if [ -f "$guard_bundle" ] && [ -O "$guard_bundle" ]; then
+    guard=(python3 -I -S "$guard_bundle")
+else
+    guard=(python3 "$HOME/scripts/agent-harnesses.py" guard)
+fi
+
 deny() {
-    local reason="$1"
-    jq -n --arg reason "$reason" '{
+    jq -n --arg reason "$1" '{
       hookSpecificOutput: {
         hookEventName: "PreToolUse",
         permissionDecision: "deny",
         permissionDecisionReason: $reason
       }
     }'
-    exit 0
 }
 
-evaluate_write() {
-    local file_path="$1"
-    local content="$2"
-    local result
-    local decision
-    local reason
-
-    result=$(python3 "$HOME/scripts/agent-harnesses.py" guard --harness "$harness" --tool write --path "$file_path" --content "$content" 2>/dev/null || true)
-    decision=$(printf '%s' "$result" | jq -r '.decision // "deny"')
-    reason=$(printf '%s' "$result" | jq -r '.reason // "Shared guard failed closed"')
-
-    if [ "$decision" = "deny" ]; then
-        deny "$reason"
-    fi
-}
-
-tool_name=$(printf '%s' "$input" | jq -r '.tool_name // empty' 2>/dev/null || echo "")
-command=$(printf '%s' "$input" | jq -r '.tool_input.command // empty' 2>/dev/null || echo "")
-
-if [ "$tool_name" = "apply_patch" ] || [[ "$command" == "*** Begin Patch"* ]]; then
-    while IFS= read -r path; do
-        [ -n "$path" ] && evaluate_write "$path" ""
-    done < <(printf '%s' "$input" | apply_patch_all_paths)
-
-    added_content=$(printf '%s' "$input" | apply_patch_added_content)
-    evaluate_write "" "$added_content"
-else
-    file_path=$(printf '%s' "$input" | jq -r '.tool_input.file_path // .tool_input.path // empty' 2>/dev/null || echo "")
-    content=$(printf '%s' "$input" | jq -r '(.tool_input.content // "") + (.tool_input.new_string // "")' 2>/dev/null || echo "")
-    evaluate_write "$file_path" "$content"
+# `--hook` reads the PreToolUse envelope on stdin as the harness sent it and
+# prints the hook reply itself. It exits 0 whatever it decides, so any other
+# status means it crashed or never started. Claude and Codex take a failing hook
+# as a non-blocking error and run the call, so that is answered with a deny.
+status=0
+reply=$("${guard[@]}" --hook "$harness") || status=$?
+if [ "$status" -ne 0 ]; then
+    deny "Shared guard failed closed (exit $status)"
+    exit 0
 fi
-
+[ -z "$reply" ] || printf '%s\n' "$reply"
 exit 0
@@ -1,25 +1,404 @@
 // Generated by scripts/agent-harnesses.py; do not edit directly.
 // Copyright: Ben Chatelain. Apache 2.0.
 
-import { execFileSync } from "node:child_process";
+import { spawn } from "node:child_process";
+import { createHash } from "node:crypto";
+import { appendFileSync, lstatSync, mkdirSync, readFileSync, realpathSync, statSync } from "node:fs";
+import { connect } from "node:net";
 import { homedir } from "node:os";
-import { join } from "node:path";
+import { basename, dirname, isAbsolute, join, resolve } from "node:path";
 import type { Plugin } from "@opencode-ai/plugin";
 
-type GuardResult = { decision: "allow" | "warn" | "deny"; reason?: string };
+const HARNESS = "opencode";
 
-function guard(args: string[]): GuardResult {
-  const script = join(homedir(), "scripts", "agent-harnesses.py");
+type GuardResult = { decision: "allow" | "warn" | "deny"; reason?: string; rule?: string };
+type GuardRequest = { tool: string; command?: string; path?: string; content?: string };
+
+const GUARD_SOCKET =
+  process.env.AGENT_HARNESS_GUARD_SOCKET || join(homedir(), ".agents", "harness", "run", "guard.sock");
+const GUARD_OVERRUN_LOG = join(homedir(), ".agents", "harness", "run", "guard-overruns.ndjson");
+const FAILED_CLOSED: GuardResult = { decision: "deny", reason: "Shared guard failed closed" };
+
+// Seconds a call may take, end to end, before it is denied. Read from the same
+// variables as guard_deadline.guard_budget, so every harness is tuned one way.
+function guardBudget(): number {
+  for (const name of [`AGENT_HARNESS_GUARD_BUDGET_${HARNESS.toUpperCase()}`, "AGENT_HARNESS_GUARD_BUDGET"]) {
+    const budget = Number(process.env[name]);
+    if (budget > 0) return budget;
+  }
+  return 2.5;
+}
+
+const GUARD_BUDGET = guardBudget();
+
+// Logged in guard_deadline.record_overrun's format, for `guard-stats`.
+function guardOverrun(stage: string): GuardResult {
+  const record = { ts: Date.now() / 1000, harness: HARNESS, budget: GUARD_BUDGET, stage };
+  try {
+    mkdirSync(dirname(GUARD_OVERRUN_LOG), { recursive: true, mode: 0o700 });
+    appendFileSync(GUARD_OVERRUN_LOG, JSON.stringify(record) + "\n", { mode: 0o600 });
+  } catch {}
+  return {
+    decision: "deny",
+    reason: `shared guard failed closed: no verdict within the ${GUARD_BUDGET} s ${HARNESS} budget (${stage} ran out)`,
+  };
+}
+
+// The policy's own rules, exported to safety-policy.json by `generate`, decide
+// most calls here without a round trip: a command no rule can match, one a
+// command rule denies, and a write that a path or secret rule decides or none
+// does. The rest go to the Python guard: what a shell command writes to, the
+// main-branch commit check, patches, generated artifacts, and anything the two
+// could read differently. AGENT_HARNESS_GUARD_NATIVE=off sends every call there.
+const HOOKS_DIR = join(homedir(), ".agents", "harness", "hooks");
+const SAFETY_SOURCE = join(HOOKS_DIR, "safety.py");
+const SAFETY_POLICY = join(HOOKS_DIR, "safety-policy.json");
+const GENERATED_MANIFEST = join(homedir(), ".agents", "harness", "generated-paths.json");
+const NATIVE_GUARD = process.env.AGENT_HARNESS_GUARD_NATIVE !== "off";
+
+// Within these characters JavaScript's regexes match as Python's do: `\s`,
+// `\w`, `\b`, `.`, and case folding differ only outside them.
+const NATIVE_TEXT = /^[\t\n\x20-\x7e]*$/;
+
+type PathRule = { id: string; family: string; literal: string; end: string };
+type NativePolicy = {
+  commandTools: string[];
+  writeTools: string[];
+  triggers: string[];
+  rewrittenWords: RegExp;
+  gitCommit: RegExp;
+  commandRules: { id: string; reason: string; pattern: RegExp }[];
+  pathRules: PathRule[];
+  pathReasons: Record<string, string>;
+  secrets: { id: string; reason: string; pattern: RegExp };
+  secretBudget: number;
+};
+
+// A value read from files, read again whenever one of them changes.
+function watched<T>(files: string[], read: () => T): () => T {
+  let stamp: string | null = null;
+  let value: T;
+  return () => {
+    const now = files
+      .map((file) => {
+        try {
+          const stat = statSync(file);
+          return `${stat.mtimeMs}:${stat.size}`;
+        } catch {
+          return "";
+        }
+      })
+      .join("|");
+    if (now !== stamp) {
+      value = read();
+      stamp = now;
+    }
+    return value;
+  };
+}
+
+// Null unless safety-policy.json was exported from safety.py as it is now.
+function readNativePolicy(): NativePolicy | null {
+  try {
+    const rules = JSON.parse(readFileSync(SAFETY_POLICY, "utf8")).rules;
+    const digest = createHash("sha256").update(readFileSync(SAFETY_SOURCE)).digest("hex");
+    if (!rules || rules.source_digest !== digest) return null;
+    const regex = (rule: { source: string; flags: string }) => new RegExp(rule.source, rule.flags);
+    // safety.py falls back to the default for anything but a positive integer;
+    // a setting it might read differently is left to it.
+    const setting = process.env[rules.secret_scan_budget.env] ?? "";
+    if (!/^\d*$/.test(setting)) return null;
+    const budget = Number(setting) || rules.secret_scan_budget.default;
+    return {
+      commandTools: rules.tools.command,
+      writeTools: rules.tools.write,
+      triggers: rules.triggers.map((literal: string) => literal.toLowerCase()),
+      rewrittenWords: regex(rules.rewritten_words),
+      gitCommit: regex(rules.git_commit),
+      commandRules: rules.command.map((rule: any) => ({ id: rule.id, reason: rule.reason, pattern: regex(rule) })),
+      pathRules: rules.paths.map((rule: any) => ({ ...rule, literal: rule.literal.toLowerCase() })),
+      pathReasons: rules.path_reasons,
+      secrets: { id: rules.secrets.id, reason: rules.secrets.reason, pattern: regex(rules.secrets) },
+      secretBudget: budget,
+    };
+  } catch {
+    return null;
+  }
+}
+
+const nativePolicy = watched([SAFETY_SOURCE, SAFETY_POLICY], readNativePolicy);
+
+// generated-paths.json's keys, as components, by their last one.
+const generatedKeys = watched([GENERATED_MANIFEST], () => {
+  const keys = new Map<string, string[][]>();
   try {
-    const output = execFileSync("python3", [script, "guard", "--harness", "opencode", ...args], {
-      encoding: "utf8",
-      stdio: ["ignore", "pipe", "pipe"],
+    for (const key of Object.keys(JSON.parse(readFileSync(GENERATED_MANIFEST, "utf8")))) {
+      const parts = key.replace(/^~\//, "").split("/");
+      const last = parts[parts.length - 1];
+      keys.set(last, [...(keys.get(last) ?? []), parts]);
+    }
+  } catch {}
+  return keys;
+});
+
+// guard_client.lookup_generated: the path ends with a manifest key.
+function isGenerated(path: string): boolean {
+  const parts = path.split("/");
+  const offset = (key: string[]) => parts.length - key.length;
+  return (generatedKeys().get(parts[parts.length - 1]) ?? []).some(
+    (key) => offset(key) >= 0 && key.every((part, index) => part === parts[offset(key) + index]),
+  );
+}
+
+// normalize_path_for_matching, for the paths both sides resolve alike: `~/` or
+// absolute, with no `..` to take past a symlink. Links resolve as far as the
+// path exists. One that leads nowhere, or any other surprise, is null.
+function nativeResolve(path: string): string | null {
+  const expanded = path === "~" || path.startsWith("~/") ? homedir() + path.slice(1) : path;
+  if (!isAbsolute(expanded) || expanded.split("/").includes("..")) return null;
+  let head = resolve(expanded);
+  const rest: string[] = [];
+  for (;;) {
+    try {
+      return join(realpathSync(head), ...rest);
+    } catch (error) {
+      if ((error as NodeJS.ErrnoException).code !== "ENOENT") return null;
+    }
+    try {
+      lstatSync(head);
+      return null;
+    } catch {}
+    rest.unshift(basename(head));
+    head = dirname(head);
+  }
+}
+
+// The first path rule, in order, whose literal the path contains followed by
+// what the rule's `end` asks for (see safety.PathRule).
+function matchPathRule(rules: PathRule[], path: string): PathRule | null {
+  const lowered = path.toLowerCase();
+  for (const rule of rules) {
+    for (let at = lowered.indexOf(rule.literal); at >= 0; at = lowered.indexOf(rule.literal, at + 1)) {
+      const next = lowered[at + rule.literal.length];
+      if (!rule.end || next === undefined || (rule.end === "name" && !/[\w.-]/.test(next))) return rule;
+    }
+  }
+  return null;
+}
+
+// safety.evaluate, for the calls it can decide alone; null hands the call on.
+function nativeVerdict(request: GuardRequest): GuardResult | null {
+  const policy = NATIVE_GUARD ? nativePolicy() : null;
+  if (!policy) return null;
+  const { command = "", path = "", content = "" } = request;
+  if (![command, path, content].every((text) => NATIVE_TEXT.test(text))) return null;
+  const tool = request.tool.toLowerCase().trim();
+  if (policy.commandTools.includes(tool)) {
+    if (!command.trim()) return { decision: "allow" };
+    const lowered = command.toLowerCase();
+    if (!policy.triggers.some((literal) => lowered.includes(literal))) {
+      // No rule can match. A word that may not be what it spells can still
+      // name a writer, and the main-branch commit check reads git.
+      const left = policy.rewrittenWords.test(command) || policy.gitCommit.test(command);
+      return left ? null : { decision: "allow" };
+    }
+    for (const rule of policy.commandRules) {
+      if (rule.pattern.test(command)) return { decision: "deny", reason: rule.reason, rule: rule.id };
+    }
+    return null;
+  }
+  if (!policy.writeTools.includes(tool)) return null;
+  const resolved = path ? nativeResolve(path) : "";
+  if (resolved === null || !NATIVE_TEXT.test(resolved)) return null;
+  const rule = resolved ? matchPathRule(policy.pathRules, resolved) : null;
+  if (rule) {
+    const reason = policy.pathReasons[rule.family].replace("{path}", () => path);
+    return { decision: "deny", reason, rule: rule.family };
+  }
+  if (content) {
+    if (content.length > policy.secretBudget) return null;
+    if (policy.secrets.pattern.test(content)) {
+      return { decision: "deny", reason: policy.secrets.reason, rule: policy.secrets.id };
+    }
+  }
+  // The Python guard's deny names the artifact's source.
+  if (resolved && isGenerated(resolved)) return null;
+  return { decision: "allow" };
+}
+
+// One NDJSON conversation with a guard, which answers requests in the order it
+// gets them. A request queues a waiter and writes its line without waiting on
+// the ones ahead of it, so calls pipeline and the event loop never blocks on a
+// verdict. Closing answers every waiter left with null.
+class GuardChannel {
+  closed = false;
+  private waiters: ((reply: GuardResult | null) => void)[] = [];
+  private buffer = "";
+  readonly stage: string;
+  private readonly send: (line: string) => void;
+  private readonly stop: () => void;
+  private readonly token: string | null;
+
+  // With a `token`, a reply that does not carry it closes the channel.
+  constructor(stage: string, send: (line: string) => void, stop: () => void, token: string | null = null) {
+    this.stage = stage;
+    this.send = send;
+    this.stop = stop;
+    this.token = token;
+  }
+
+  request(request: GuardRequest): Promise<GuardResult | null> {
+    return new Promise((resolve) => {
+      if (this.closed) return resolve(null);
+      this.waiters.push(resolve);
+      this.send(JSON.stringify({ harness: HARNESS, ...request }) + "\n");
     });
-    return JSON.parse(output) as GuardResult;
-  } catch (error: any) {
-    const output = error?.stdout?.toString?.() || "";
-    if (output) return JSON.parse(output) as GuardResult;
-    return { decision: "deny", reason: "Shared guard failed closed" };
+  }
+
+  receive(chunk: string): void {
+    this.buffer += chunk;
+    let end: number;
+    while ((end = this.buffer.indexOf("\n")) >= 0) {
+      const line = this.buffer.slice(0, end);
+      this.buffer = this.buffer.slice(end + 1);
+      let reply: any = null;
+      try {
+        reply = JSON.parse(line);
+      } catch {}
+      if (this.token !== null) {
+        if (reply?.token !== this.token) return this.close();
+        delete reply.token;
+      }
+      this.waiters.shift()?.(typeof reply?.decision === "string" ? (reply as GuardResult) : FAILED_CLOSED);
+    }
+  }
+
+  close(): void {
+    if (this.closed) return;
+    this.closed = true;
+    this.stop();
+    for (const waiter of this.waiters.splice(0)) waiter(null);
+  }
+}
+
+// guard-server's startup token, when its socket and token file are this user's
+// alone; otherwise null, and the server is not asked. Node cannot read a Unix
+// socket peer's credentials, so the socket's owner stands in for them.
+function serverToken(): string | null {
+  const token = `${GUARD_SOCKET}.token`;
+  if (!ownedPrivately(GUARD_SOCKET) || !ownedPrivately(token)) return null;
+  try {
+    return readFileSync(token, "utf8").trim() || null;
+  } catch {
+    return null;
+  }
+}
+
+// Whether `path` itself is this user's and closed to everyone else.
+function ownedPrivately(path: string): boolean {
+  try {
+    const stat = lstatSync(path);
+    return stat.uid === process.getuid?.() && !(stat.mode & 0o077);
+  } catch {
+    return false;
+  }
+}
+
+// A running `agent-harnesses.py guard-server`, over one connection kept open.
+// Resolves null when nothing trustworthy is listening.
+function openServer(): Promise<GuardChannel | null> {
+  return new Promise((resolve) => {
+    const token = serverToken();
+    if (!token) return resolve(null);
+    const socket = connect(GUARD_SOCKET);
+    socket.setEncoding("utf8");
+    socket.unref();
+    const channel = new GuardChannel(
+      "guard-server",
+      (line) => socket.write(line),
+      () => socket.destroy(),
+      token,
+    );
+    socket.on("connect", () => resolve(channel));
+    socket.on("data", (chunk: string) => channel.receive(chunk));
+    socket.on("error", () => channel.close());
+    socket.on("close", () => {
+      channel.close();
+      resolve(null);
+    });
+  });
+}
+
+// Otherwise one long-lived `guard --stdin` child, started on first use. Calls
+// reach it on stdin, not argv, so a large write cannot hit ARG_MAX. The
+// guard bundle `generate` builds under run/ starts faster than the generator
+// script, which is the fallback until there is one this user alone owns.
+function guardArgv(): string[] {
+  const bundle = join(homedir(), ".agents", "harness", "run", "harness-guard.pyz");
+  if (ownedPrivately(bundle)) return ["-I", "-S", bundle];
+  return [join(homedir(), "scripts", "agent-harnesses.py"), "guard"];
+}
+
+function openChild(): GuardChannel {
+  const child = spawn("python3", [...guardArgv(), "--harness", HARNESS, "--stdin"], {
+    stdio: ["pipe", "pipe", "ignore"],
+  });
+  const channel = new GuardChannel(
+    "spawned guard",
+    (line) => child.stdin.write(line),
+    () => child.kill(),
+  );
+  child.stdout.setEncoding("utf8");
+  child.stdout.on("data", (chunk: string) => channel.receive(chunk));
+  child.stdin.on("error", () => channel.close());
+  child.on("error", () => channel.close());
+  child.on("exit", () => channel.close());
+  // An idle guard must not keep the harness from exiting.
+  child.unref();
+  (child.stdin as any).unref?.();
+  (child.stdout as any).unref?.();
+  return channel;
+}
+
+let channel: Promise<GuardChannel> | null = null;
+
+// Calls the exported rules decide never reach a guard. Otherwise a channel
+// that closes with calls waiting is replaced once by the child, so a
+// guard-server going away mid-call, or answering without its token, falls
+// through to it; anything short of a verdict after that denies. So does the budget running out, which also closes the channel
+// the call is stuck on, and the calls queued behind it.
+async function guard(request: GuardRequest): Promise<GuardResult> {
+  let native: GuardResult | null = null;
+  try {
+    native = nativeVerdict(request);
+  } catch {}
+  if (native) return native;
+  let current: GuardChannel | null = null;
+  let timer: ReturnType<typeof setTimeout> | undefined;
+  const overrun = new Promise<GuardResult>((resolve) => {
+    timer = setTimeout(() => {
+      resolve(guardOverrun(current?.stage ?? "guard-server"));
+      current?.close();
+    }, GUARD_BUDGET * 1000);
+  });
+  const answer = (async () => {
+    for (let attempt = 0; attempt < 2; attempt++) {
+      if (!channel) {
+        const server = attempt === 0 ? openServer() : Promise.resolve(null);
+        channel = server.then((found) => found ?? openChild());
+      }
+      const opened = channel;
+      current = await opened;
+      const reply = await current.request(request);
+      if (reply) return reply;
+      if (channel === opened) channel = null;
+    }
+    return FAILED_CLOSED;
+  })();
+  try {
+    return await Promise.race([answer, overrun]);
+  } finally {
+    clearTimeout(timer);
   }
 }
 
@@ -37,11 +416,11 @@ export const HarnessPlugin: Plugin = async () => ({
     let result: GuardResult = { decision: "allow" };
 
     if (input.tool === "bash") {
-      result = guard(["--tool", "bash", "--command", String(args.command || "")]);
+      result = await guard({ tool: "bash", command: String(args.command || "") });
     } else if (input.tool === "write" || input.tool === "edit") {
       const path = String(args.file_path || args.path || "");
       const content = String(args.content || args.new_string || "");
-      result = guard(["--tool", input.tool, "--path", path, "--content", content]);
+      result = await guard({ tool: input.tool, path, content });
     }
 
     if (result.decision === "deny") {
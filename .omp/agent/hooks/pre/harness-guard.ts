@@ -11,6 +11,12 @@ import { join } from "node:path";
 import type { HookAPI } from "@oh-my-pi/pi-coding-agent/extensibility/hooks";
 
 type GuardResult = { decision: "allow" | "warn" | "deny"; reason?: string };
+type GuardRequest = {
+  tool: string;
+  command?: string;
+  path?: string;
+  content?: string;
+};
 
 // execFileSync throws on a non-zero exit, attaching the captured streams to
 // the error. Read stdout back off it without asserting a shape we cannot check.
@@ -23,13 +29,18 @@ function stdoutOf(error: unknown): string {
   return "";
 }
 
-function guard(args: string[]): GuardResult {
+// The call goes over stdin, not argv, so a large write cannot hit ARG_MAX.
+function guard(request: GuardRequest): GuardResult {
   const script = join(homedir(), "scripts", "agent-harnesses.py");
   try {
     const output = execFileSync(
       "python3",
-      [script, "guard", "--harness", "omp", ...args],
-      { encoding: "utf8", stdio: ["ignore", "pipe", "pipe"] },
+      [script, "guard", "--harness", "omp", "--stdin"],
+      {
+        encoding: "utf8",
+        input: JSON.stringify(request) + "\n",
+        stdio: ["pipe", "pipe", "pipe"],
+      },
     );
     return JSON.parse(output) as GuardResult;
   } catch (error: unknown) {
@@ -44,18 +55,16 @@ export default function hook(pi: HookAPI): void {
   pi.on("tool_call", async (event) => {
     let result: GuardResult = { decision: "allow" };
     if (event.toolName === "bash") {
-      result = guard([
-        "--tool",
-        "bash",
-        "--command",
-        String(event.input.command ?? ""),
-      ]);
+      result = guard({
+        tool: "bash",
+        command: String(event.input.command ?? ""),
+      });
     } else if (event.toolName === "write" || event.toolName === "edit") {
       const path = String(event.input.file_path ?? event.input.path ?? "");
       const content = String(
         event.input.content ?? event.input.new_string ?? "",
       );
-      result = guard(["--tool", event.toolName, "--path", path, "--content", content]);
+      result = guard({ tool: event.toolName, path, content });
     }
     if (result.decision === "deny") {
       return {
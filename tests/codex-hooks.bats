@@ -156,6 +156,46 @@ PY
     [ -z "$output" ]
 }
 
+@test "bash guard: answers in one guard process without jq" {
+    bindir="$BATS_TEST_TMPDIR/bin"
+    mkdir -p "$bindir"
+    printf '#!/bin/sh\necho jq >>"%s"\nexit 1\n' "$BATS_TEST_TMPDIR/jq.log" > "$bindir/jq"
+    chmod +x "$bindir/jq"
+    input=$(printf '{"tool_name": "Bash", "tool_input": {"command": "rm -rf /"}}')
+
+    run env PATH="$bindir:$PATH" bash -c 'printf "%s" "$1" | "$2"' bash "$input" \
+        "$HOME/.codex/hooks/scripts/bash-guard.sh"
+
+    [ "$status" -eq 0 ]
+    [ "$(printf '%s' "$output" | jq -r '.hookSpecificOutput.permissionDecision')" = "deny" ]
+    [ ! -e "$BATS_TEST_TMPDIR/jq.log" ]
+}
+
+@test "bash guard: denies when the guard crashes or cannot start" {
+    bindir="$BATS_TEST_TMPDIR/bin"
+    mkdir -p "$bindir"
+    printf '#!/bin/sh\necho "Traceback (most recent call last):" >&2\nexit 1\n' > "$bindir/python3"
+    chmod +x "$bindir/python3"
+    input=$(printf '{"tool_name": "Bash", "tool_input": {"command": "rm -rf /"}}')
+
+    run env PATH="$bindir:$PATH" bash -c 'printf "%s" "$1" | "$2" 2>/dev/null' bash "$input" \
+        "$HOME/.codex/hooks/scripts/bash-guard.sh"
+    [ "$status" -eq 0 ]
+    [ "$(printf '%s' "$output" | jq -r '.hookSpecificOutput.permissionDecision')" = "deny" ]
+
+    # A setting the policy cannot parse leaves it enforcing, not crashed.
+    run env AGENT_HARNESS_SECRET_SCAN_BUDGET=16M bash -c 'printf "%s" "$1" | "$2"' bash "$input" \
+        "$HOME/.codex/hooks/scripts/bash-guard.sh"
+    [ "$status" -eq 0 ]
+    [ "$(printf '%s' "$output" | jq -r '.hookSpecificOutput.permissionDecision')" = "deny" ]
+
+    input=$(printf '{"tool_name": "Bash", "tool_input": {"command": "ls"}}')
+    run env PATH="$bindir:$PATH" bash -c 'printf "%s" "$1" | "$2" 2>/dev/null' bash "$input" \
+        "$HOME/.codex/hooks/scripts/bash-guard.sh"
+    [ "$status" -eq 0 ]
+    [ "$(printf '%s' "$output" | jq -r '.hookSpecificOutput.permissionDecision')" = "deny" ]
+}
+
 @test "auto format: formats every existing file changed by apply_patch" {
     workdir="$BATS_TEST_TMPDIR/project"
     bindir="$BATS_TEST_TMPDIR/bin"